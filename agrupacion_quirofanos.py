@@ -0,0 +1,139 @@
+# Agrupación jerárquica de quirófanos (hospital -> planta -> ala -> quirófano) con agregados
+# que se mantienen de forma incremental: al llegar una lectura solo se actualizan el
+# quirófano y sus grupos antecesores, sin recorrer el resto de quirófanos.
+#
+# Agregados de cada grupo:
+#   - peor quirófano por variable (el más alejado del rango seguro o, si todos están dentro,
+#     el más cercano a salirse), mediante un montículo con borrado perezoso
+#   - número de quirófanos en alarma
+#   - presión diferencial media
+import heapq
+
+VARIABLES = ('temperatura', 'humedad', 'presion')
+
+# Distribución por defecto: 3 quirófanos por ala y 2 alas por planta
+QUIROFANOS_POR_ALA = 3
+ALAS_POR_PLANTA = 2
+
+def ubicacion_por_defecto(quirofano_id):
+    # Ruta (planta, ala) de un quirófano según su número
+    indice = quirofano_id - 1
+    planta = indice // (QUIROFANOS_POR_ALA * ALAS_POR_PLANTA) + 1
+    ala = (indice // QUIROFANOS_POR_ALA) % ALAS_POR_PLANTA
+    return (f"Planta {planta}", f"Ala {chr(ord('A') + ala)}")
+
+def severidad(valor, rango):
+    # Distancia fuera del rango seguro; dentro del rango es negativa (margen hasta el límite)
+    return max(rango[0] - valor, valor - rango[1])
+
+class GrupoQuirofanos:
+    def __init__(self, nombre, padre=None):
+        self.nombre = nombre
+        self.padre = padre
+        self.hijos = {}        # nombre -> GrupoQuirofanos
+        self.quirofanos = []   # quirófanos que cuelgan directamente de este grupo
+        self.num_quirofanos = 0
+
+        # Agregados incrementales
+        self.en_alarma = 0
+        self.suma_presion = 0.0
+        self.con_lectura = 0
+        self.severidades = {variable: {} for variable in VARIABLES}
+        self.monticulos = {variable: [] for variable in VARIABLES}
+
+    def presion_media(self):
+        if not self.con_lectura:
+            return None
+        return self.suma_presion / self.con_lectura
+
+    def peor(self, variable):
+        # (quirofano_id, severidad) del peor quirófano, o None si aún no hay lecturas
+        monticulo = self.monticulos[variable]
+        actuales = self.severidades[variable]
+        while monticulo:
+            severidad_negativa, quirofano_id = monticulo[0]
+            if actuales.get(quirofano_id) == -severidad_negativa:
+                return quirofano_id, -severidad_negativa
+            # Entrada obsoleta de una lectura anterior
+            heapq.heappop(monticulo)
+        return None
+
+    def fijar_severidad(self, variable, quirofano_id, valor):
+        actuales = self.severidades[variable]
+        actuales[quirofano_id] = valor
+        monticulo = self.monticulos[variable]
+        heapq.heappush(monticulo, (-valor, quirofano_id))
+
+        # Reconstruir cuando las entradas obsoletas dominan, para acotar la memoria
+        if len(monticulo) > 2 * len(actuales) + 16:
+            monticulo[:] = [(-s, q) for q, s in actuales.items()]
+            heapq.heapify(monticulo)
+
+class ModeloAgrupacion:
+    def __init__(self, quirofanos, rangos, ubicacion=ubicacion_por_defecto, nombre="Hospital"):
+        self.rangos = rangos
+        self.raiz = GrupoQuirofanos(nombre)
+
+        # Grupos de cada quirófano, del más cercano (ala) a la raíz
+        self.grupos_quirofano = {}
+        self.grupo_directo = {}
+
+        # Última lectura y estado de alarma de cada quirófano
+        self.lecturas = {}
+        self.en_alarma = {}
+
+        # Cambios desde la última vez que se pintó la vista
+        self.quirofanos_cambiados = set()
+        self.grupos_cambiados = set()
+
+        for quirofano_id in quirofanos:
+            grupo = self.raiz
+            cadena = [grupo]
+            for nombre_grupo in ubicacion(quirofano_id):
+                if nombre_grupo not in grupo.hijos:
+                    grupo.hijos[nombre_grupo] = GrupoQuirofanos(nombre_grupo, grupo)
+                grupo = grupo.hijos[nombre_grupo]
+                cadena.append(grupo)
+            grupo.quirofanos.append(quirofano_id)
+            for antecesor in cadena:
+                antecesor.num_quirofanos += 1
+            self.grupos_quirofano[quirofano_id] = cadena[::-1]
+            self.grupo_directo[quirofano_id] = grupo
+
+    def grupos(self):
+        # Todos los grupos, de la raíz hacia las hojas
+        pendientes = [self.raiz]
+        while pendientes:
+            grupo = pendientes.pop(0)
+            yield grupo
+            pendientes.extend(grupo.hijos.values())
+
+    def actualizar(self, quirofano_id, temperatura, humedad, presion):
+        valores = {'temperatura': temperatura, 'humedad': humedad, 'presion': presion}
+        severidades = {variable: severidad(valores[variable], self.rangos[variable]) for variable in VARIABLES}
+        alarma = any(s > 0 for s in severidades.values())
+
+        anterior = self.lecturas.get(quirofano_id)
+        cambio_alarma = int(alarma) - int(self.en_alarma.get(quirofano_id, False))
+        self.lecturas[quirofano_id] = valores
+        self.en_alarma[quirofano_id] = alarma
+
+        # Aplicar la diferencia a cada antecesor: coste proporcional a la profundidad
+        for grupo in self.grupos_quirofano[quirofano_id]:
+            for variable in VARIABLES:
+                grupo.fijar_severidad(variable, quirofano_id, severidades[variable])
+            grupo.en_alarma += cambio_alarma
+            if anterior is None:
+                grupo.con_lectura += 1
+                grupo.suma_presion += presion
+            else:
+                grupo.suma_presion += presion - anterior['presion']
+            self.grupos_cambiados.add(grupo)
+
+        self.quirofanos_cambiados.add(quirofano_id)
+
+    def tomar_cambios(self):
+        # Quirófanos y grupos modificados desde la llamada anterior
+        quirofanos, grupos = self.quirofanos_cambiados, self.grupos_cambiados
+        self.quirofanos_cambiados, self.grupos_cambiados = set(), set()
+        return quirofanos, grupos
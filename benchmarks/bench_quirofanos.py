@@ -0,0 +1,286 @@
+# Benchmarks reproducibles de las rutas críticas del sistema de control de quirófanos.
+#
+# Uso:
+#   python benchmarks/bench_quirofanos.py                      # medir y comparar con la línea base
+#   python benchmarks/bench_quirofanos.py --guardar-baseline   # medir y guardar la línea base
+#   python benchmarks/bench_quirofanos.py --quirofanos 6,60    # limitar los tamaños medidos
+#
+# Se ejecuta sin pantalla (QT_QPA_PLATFORM=offscreen) y devuelve código 1 si alguna
+# métrica empeora más que la tolerancia indicada respecto a la línea base guardada.
+# Cada métrica se mide tras unas ejecuciones de calentamiento y se toma el mínimo de las
+# repeticiones; la tolerancia de cada métrica se amplía según la dispersión medida, para
+# que el ruido de la máquina no se confunda con una regresión.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# Permitir importar el módulo principal desde la raíz del repositorio
+DIRECTORIO_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_BENCH))
+
+from PyQt5.QtWidgets import QApplication
+
+from control_quirofanos import (SensorSimulado, VentanaPrincipal, RANGO_TEMPERATURA,
+                                RANGO_HUMEDAD, RANGO_PRESION, fecha_grafica)
+
+ARCHIVO_BASELINE = os.path.join(DIRECTORIO_BENCH, "baseline.json")
+TAMAÑOS_QUIROFANOS = (6, 60, 600)
+LONGITUDES_HISTORIAL = (60, 600, 6000)
+TOLERANCIA = 0.25  # 25 % de empeoramiento permitido como mínimo
+FACTOR_DISPERSION = 3  # la tolerancia de cada métrica es al menos 3 veces su dispersión
+REPETICIONES = 10
+CALENTAMIENTO = 2  # ejecuciones descartadas (cachés, primer dibujado, importaciones perezosas)
+# Cada medición vuelve a fijar la semilla: los hilos de muestreo de las ventanas de arranque
+# consumen números aleatorios según cuánto tardan, y sin esto los datos cambiarían entre ejecuciones
+SEMILLA = 0
+
+
+def medir(funcion, repeticiones, calentamiento=CALENTAMIENTO):
+    # Mínimo del tiempo de varias ejecuciones, en segundos, y su dispersión relativa
+    # ((mediana - mínimo) / mínimo)
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    minimo = min(tiempos)
+    return minimo, statistics.median(tiempos) / minimo - 1.0
+
+
+def datos_simulados(en_rango):
+    # Lectura con la misma forma que emite SensorSimulado
+    if en_rango:
+        temp = random.uniform(*RANGO_TEMPERATURA)
+        hum = random.uniform(*RANGO_HUMEDAD)
+        pres = random.uniform(*RANGO_PRESION)
+    else:
+        temp = RANGO_TEMPERATURA[1] + random.uniform(0.1, 3)
+        hum = RANGO_HUMEDAD[0] - random.uniform(0.1, 10)
+        pres = RANGO_PRESION[1] + random.uniform(0.1, 5)
+    return {
+        'temperatura': temp,
+        'humedad': hum,
+        'presion': pres,
+        'timestamp': time.time(),
+        'en_uso': not en_rango
+    }
+
+
+def bench_sensor(num_quirofanos, repeticiones, pasos=50):
+    # Tiempo por paso de simulación, recorriendo todos los quirófanos
+    random.seed(SEMILLA)
+    sensores = [SensorSimulado(i + 1) for i in range(num_quirofanos)]
+    for i, sensor in enumerate(sensores):
+        sensor.cambiar_estado(i % 2 == 0)
+
+    def ronda():
+        for _ in range(pasos):
+            for sensor in sensores:
+                sensor.generar_lectura()
+
+    total, dispersion = medir(ronda, repeticiones)
+    return total / (pasos * num_quirofanos), dispersion
+
+
+def bench_panel(ventana, repeticiones, rondas=5):
+    # Tiempo por llamada a PanelQuirofano.actualizar_panel (mitad en rango, mitad fuera),
+    # incluyendo la pasada del compositor que pinta los paneles
+    random.seed(SEMILLA)
+    paneles = ventana.pestaña_general.paneles_quirofano
+    compositor = ventana.pestaña_general.compositor
+    lecturas = [[datos_simulados((i + j) % 2 == 0) for i in range(len(paneles))] for j in range(rondas)]
+
+    def ronda():
+        for lecturas_ronda in lecturas:
+            for panel, datos in zip(paneles, lecturas_ronda):
+                panel.actualizar_panel(datos)
+            compositor.componer()
+        QApplication.processEvents()
+
+    total, dispersion = medir(ronda, repeticiones)
+    return total / (rondas * len(paneles)), dispersion
+
+
+def bench_agrupacion(ventana, repeticiones, lecturas=60, por_cuadro=3):
+    # Tiempo por lectura en la vista por plantas (modelo incremental y repintado de lo que
+    # cambió) cuando en cada cuadro solo cambian unos pocos quirófanos
+    random.seed(SEMILLA)
+    pestaña = ventana.pestaña_agrupacion
+    ids = [panel.quirofano_id for panel in ventana.pestaña_general.paneles_quirofano]
+    valores = [(ids[i % len(ids)], datos_simulados(i % 2 == 0)) for i in range(lecturas)]
+
+    def ronda():
+        for i, (quirofano_id, datos) in enumerate(valores):
+            pestaña.modelo.actualizar(quirofano_id, datos['temperatura'], datos['humedad'], datos['presion'])
+            if i % por_cuadro == por_cuadro - 1:
+                pestaña.pintar()
+
+    total, dispersion = medir(ronda, repeticiones)
+    return total / lecturas, dispersion
+
+
+def bench_grafica(ventana, longitud, repeticiones, cuadros=5):
+    # Tiempo por cuadro de GraficaMonitoreo.actualizar_datos con un historial dado
+    random.seed(SEMILLA)
+    canvas = ventana.pestaña_visualizacion.canvas
+    ahora = time.time()
+    fechas = [fecha_grafica(ahora - (longitud - i) * 2) for i in range(longitud)]
+    temp = [random.uniform(*RANGO_TEMPERATURA) for _ in range(longitud)]
+    hum = [random.uniform(*RANGO_HUMEDAD) for _ in range(longitud)]
+    pres = [random.uniform(*RANGO_PRESION) for _ in range(longitud)]
+
+    def ronda():
+        for _ in range(cuadros):
+            canvas.actualizar_datos(fechas, temp, hum, pres)
+
+    total, dispersion = medir(ronda, repeticiones)
+    return total / cuadros, dispersion
+
+
+def bench_alertas(ventana, repeticiones, alertas=200):
+    # Tiempo por llamada a PestañaGeneral.mostrar_alerta mientras se acumulan alertas
+    pestaña = ventana.pestaña_general
+    num_quirofanos = len(pestaña.paneles_quirofano)
+
+    def ronda():
+        pestaña.historial_alertas.clear()
+        for i in range(alertas):
+            pestaña.mostrar_alerta(i % num_quirofanos + 1, "temperatura, presión")
+
+    total, dispersion = medir(ronda, repeticiones)
+    return total / alertas, dispersion
+
+
+def bench_arranque(num_quirofanos, repeticiones):
+    # Tiempo de construcción y primer pintado de VentanaPrincipal
+    ventanas = []
+
+    def arrancar():
+        ventana = VentanaPrincipal(num_quirofanos=num_quirofanos)
+        ventana.show()
+        QApplication.processEvents()
+        ventanas.append(ventana)
+
+    def cerrar():
+        # Fuera de la medición
+        while ventanas:
+            ventana = ventanas.pop()
+            ventana.detener_sensores()
+            ventana.close()
+            ventana.deleteLater()
+        QApplication.processEvents()
+
+    def ronda():
+        cerrar()
+        arrancar()
+
+    resultado = medir(ronda, repeticiones, calentamiento=1)
+    cerrar()
+    return resultado
+
+
+def ejecutar(tamaños, repeticiones):
+    resultados = {}
+    for num_quirofanos in tamaños:
+        print(f"Midiendo {num_quirofanos} quirófanos...", file=sys.stderr)
+        metricas = {}
+        metricas['sensor_paso'] = bench_sensor(num_quirofanos, repeticiones)
+        metricas['arranque_ventana'] = bench_arranque(num_quirofanos, max(3, repeticiones // 2))
+
+        # El resto de mediciones se hace sobre una ventana con los sensores detenidos
+        random.seed(SEMILLA)
+        ventana = VentanaPrincipal(num_quirofanos=num_quirofanos)
+        ventana.detener_sensores()
+        ventana.show()
+        QApplication.processEvents()
+
+        metricas['panel_actualizar'] = bench_panel(ventana, repeticiones)
+        metricas['agrupacion_lectura'] = bench_agrupacion(ventana, repeticiones)
+        for longitud in LONGITUDES_HISTORIAL:
+            metricas[f'grafica_cuadro_h{longitud}'] = bench_grafica(ventana, longitud, repeticiones)
+        metricas['alerta_mostrar'] = bench_alertas(ventana, repeticiones)
+
+        ventana.close()
+        ventana.deleteLater()
+        QApplication.processEvents()
+        resultados[str(num_quirofanos)] = metricas
+    return resultados
+
+
+def comparar(resultados, baseline, tolerancia):
+    # Devuelve la lista de métricas que empeoraron más que su tolerancia: la general o, si es
+    # mayor, FACTOR_DISPERSION veces la dispersión medida ahora o al guardar la línea base
+    regresiones = []
+    for tamaño, metricas in resultados.items():
+        base = baseline.get(tamaño, {})
+        for nombre, (valor, dispersion) in metricas.items():
+            if nombre not in base:
+                print(f"{tamaño:>5} {nombre:<22} {'(sin línea base)':>15} -> {valor * 1e3:12.3f} ms")
+                continue
+            valor_base, dispersion_base = base[nombre] if isinstance(base[nombre], list) else (base[nombre], 0.0)
+            limite = max(tolerancia, FACTOR_DISPERSION * max(dispersion, dispersion_base))
+            cambio = valor / valor_base - 1.0
+            marca = "REGRESIÓN" if cambio > limite else ""
+            print(f"{tamaño:>5} {nombre:<22} {valor_base * 1e3:12.3f} ms -> {valor * 1e3:12.3f} ms  "
+                  f"{cambio:+7.1%} (límite {limite:+.0%}) {marca}")
+            if cambio > limite:
+                regresiones.append((tamaño, nombre, cambio))
+    return regresiones
+
+
+def mostrar(resultados):
+    for tamaño, metricas in resultados.items():
+        for nombre, (valor, dispersion) in metricas.items():
+            print(f"{tamaño:>5} {nombre:<22} {valor * 1e3:12.3f} ms  ±{dispersion:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del sistema de control de quirófanos")
+    parser.add_argument("--quirofanos", default=",".join(str(n) for n in TAMAÑOS_QUIROFANOS),
+                        help="tamaños a medir, separados por comas")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--baseline", default=ARCHIVO_BASELINE)
+    parser.add_argument("--guardar-baseline", action="store_true")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    tamaños = [int(n) for n in args.quirofanos.split(",") if n]
+    resultados = ejecutar(tamaños, args.repeticiones)
+
+    if args.guardar_baseline:
+        # Conservar los tamaños que no se midieron en esta ejecución
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(resultados)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        mostrar(resultados)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        mostrar(resultados)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regresiones = comparar(resultados, baseline, args.tolerancia)
+    if regresiones:
+        print(f"{len(regresiones)} métrica(s) empeoraron más que su tolerancia", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
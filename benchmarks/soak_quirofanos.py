@@ -0,0 +1,139 @@
+# Prueba de larga duración con reloj acelerado: simula semanas de funcionamiento en minutos
+# y comprueba que la memoria residente (RSS) se mantiene estable.
+#
+# Uso:
+#   python benchmarks/soak_quirofanos.py                  # un mes simulado, 6 quirófanos
+#   python benchmarks/soak_quirofanos.py --dias 2 --quirofanos 60
+#   python benchmarks/soak_quirofanos.py --tracemalloc    # añadir el informe de asignadores
+#
+# Cada paso avanza el reloj acelerado, que comparten los sensores y PlanificadorMuestreo, y
+# el planificador muestrea los quirófanos que tocan y emite sus lecturas: llegan por la señal
+# actualizar_datos a los paneles, a la vista por plantas y al WAL, como en la aplicación.
+# Después se ejecuta una pasada del compositor; el WAL y los checkpoints los escribe el hilo de
+# persistencia en tiempo real. Cada hora simulada se refrescan la vista por plantas y las
+# gráficas de la pestaña de visualización y se mide el RSS.
+# Devuelve código 1 si el RSS crece más de la tolerancia tras el día de calentamiento.
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import argparse
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# Permitir importar los módulos desde la raíz del repositorio
+DIRECTORIO_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_BENCH))
+
+from PyQt5.QtWidgets import QApplication
+
+from control_quirofanos import VentanaPrincipal, INTERVALO_RAPIDO, INTERVALO_BASE, MAX_HISTORIAL, MAX_ALERTAS
+from notificaciones_quirofanos import DespachadorNotificaciones, SumideroLocal
+from memoria_quirofanos import MonitorMemoria, rss_actual
+from persistencia_quirofanos import PersistenciaQuirofanos
+
+SEGUNDOS_DIA = 24 * 3600
+PASO_SEGUNDOS = INTERVALO_RAPIDO  # el intervalo de muestreo más corto
+TOLERANCIA_MIB = 10.0      # crecimiento de RSS permitido tras el calentamiento
+
+class RelojAcelerado:
+    def __init__(self, inicio):
+        self.ahora = inicio
+
+    def __call__(self):
+        return self.ahora
+
+    def avanzar(self, segundos):
+        self.ahora += segundos
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de memoria de larga duración")
+    parser.add_argument("--dias", type=float, default=30, help="días simulados")
+    parser.add_argument("--quirofanos", type=int, default=6)
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_MIB, help="MiB de crecimiento permitidos")
+    parser.add_argument("--tracemalloc", action="store_true", help="mostrar los mayores asignadores al final")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    # Con el reloj acelerado las alertas llegan mucho más rápido de lo que el sumidero las
+    # despacha en tiempo real: la cola estará saturada casi siempre y no interesa el aviso
+    logging.getLogger("notificaciones_quirofanos").setLevel(logging.ERROR)
+    despachador = DespachadorNotificaciones([SumideroLocal()])
+    despachador.iniciar()
+
+    directorio_estado = tempfile.mkdtemp(prefix="soak_quirofanos_")
+    persistencia = PersistenciaQuirofanos(directorio_estado, MAX_HISTORIAL, MAX_ALERTAS, INTERVALO_BASE)
+    ventana = VentanaPrincipal(num_quirofanos=args.quirofanos, despachador=despachador,
+                               persistencia=persistencia)
+
+    # Parar el hilo de muestreo: la prueba muestrea desde este hilo con el reloj acelerado
+    planificador = ventana.pestaña_general.planificador
+    planificador.detener()
+    ventana.show()
+    QApplication.processEvents()
+
+    # Sustituir el reloj de los sensores y del planificador y poner la mitad de los quirófanos en uso
+    paneles = ventana.pestaña_general.paneles_quirofano
+    reloj = RelojAcelerado(time.time())
+    planificador.reloj = reloj
+    for panel in paneles:
+        panel.sensor.reloj = reloj
+        if panel.quirofano_id % 2:
+            panel.btn_cambiar_estado.click()
+
+    compositor = ventana.pestaña_general.compositor
+    visualizacion = ventana.pestaña_visualizacion
+    monitor = MonitorMemoria() if args.tracemalloc else None
+
+    agrupacion = ventana.pestaña_agrupacion
+    pasos_hora = int(3600 / PASO_SEGUNDOS)
+    horas = int(args.dias * 24)
+    rss_base = None
+    muestras = []
+    for hora in range(horas):
+        for _ in range(pasos_hora):
+            reloj.avanzar(PASO_SEGUNDOS)
+            planificador.muestrear_pendientes()
+            compositor.componer()
+
+        agrupacion.pintar()
+
+        # Refrescar la vista detallada de un quirófano distinto cada hora
+        visualizacion.combo_quirofano.setCurrentIndex(hora % len(paneles))
+        visualizacion.actualizar_graficas()
+        QApplication.processEvents()
+
+        rss = rss_actual()
+        muestras.append(rss)
+        if hora + 1 == 24:
+            # Fin del día de calentamiento: referencia para el resto de la prueba
+            rss_base = rss
+            if monitor is not None:
+                monitor.iniciar()
+        if (hora + 1) % 24 == 0:
+            print(f"Día {(hora + 1) // 24:3d}: RSS {rss / 2**20:8.1f} MiB", flush=True)
+
+    ventana.detener_sensores()
+    despachador.detener()
+    shutil.rmtree(directorio_estado, ignore_errors=True)
+    if monitor is not None:
+        print(monitor.informe())
+        monitor.detener()
+
+    if rss_base is None:
+        print("La prueba debe durar al menos un día simulado para comparar el RSS")
+        return 0
+
+    crecimiento = (muestras[-1] - rss_base) / 2**20
+    print(f"RSS tras el calentamiento: {rss_base / 2**20:.1f} MiB, final: {muestras[-1] / 2**20:.1f} MiB, "
+          f"máximo: {max(muestras) / 2**20:.1f} MiB, crecimiento: {crecimiento:+.1f} MiB")
+    if crecimiento > args.tolerancia:
+        print(f"El RSS creció más de {args.tolerancia:.1f} MiB")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,25 @@
+import os
 import sys  
+import math
+import time
+import heapq
 import random
+import argparse
+import threading
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QHBoxLayout, QGridLayout, QLabel, QPushButton, QComboBox,
-                            QFrame, QTabWidget, QGroupBox, QMessageBox)
-from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal
+                            QFrame, QTabWidget, QGroupBox, QMessageBox, QTreeWidget,
+                            QTreeWidgetItem)
+from PyQt5.QtCore import QTimer, Qt, QThread, QObject, QEvent, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QFont, QColor, QPalette, QIcon, QPixmap
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.dates as mdates
 
+from agrupacion_quirofanos import ModeloAgrupacion, VARIABLES
+
 # Configuración global de estilos
 COLOR_PRINCIPAL = "#2C3E50"
 COLOR_SECUNDARIO = "#ECF0F1"
@@ -24,21 +33,127 @@ RANGO_TEMPERATURA = (18.0, 24.0)  # °C
 RANGO_HUMEDAD = (30.0, 60.0)      # %
 RANGO_PRESION = (10.0, 20.0)      # Pa (presión positiva)
 
-# Clase para simular sensores y generar datos
-class SensorSimulado(QThread):
+# Distribución de quirófanos en la vista general
+NUM_QUIROFANOS = 6
+COLUMNAS_QUIROFANOS = 3
+
+# Número de registros de historial (como mucho uno cada INTERVALO_BASE, ver sustituir_ultima_muestra)
+# y de alertas recientes que se conservan
+MAX_HISTORIAL = 60
+MAX_ALERTAS = 10
+
+# Nombres de las variables tal como se muestran en las alertas
+NOMBRES_VARIABLES = {'temperatura': "temperatura", 'humedad': "humedad", 'presion': "presión"}
+
+# Epoch Unix en el formato numérico de fechas de matplotlib (0 con el origen por defecto, 1970)
+FECHA_EPOCH_UNIX = mdates.date2num(datetime(1970, 1, 1))
+
+def fecha_grafica(timestamp):
+    # Fecha en el formato numérico de matplotlib (hora local), calculada una vez por muestra.
+    # Equivale a date2num(datetime.fromtimestamp(timestamp)) pero sin crear objetos datetime
+    return (timestamp + time.localtime(timestamp).tm_gmtoff) / 86400.0 + FECHA_EPOCH_UNIX
+
+def evaluar_alertas(temperatura, humedad, presion):
+    # Indica qué variables están fuera de su rango seguro
+    return {
+        'temperatura': not (RANGO_TEMPERATURA[0] <= temperatura <= RANGO_TEMPERATURA[1]),
+        'humedad': not (RANGO_HUMEDAD[0] <= humedad <= RANGO_HUMEDAD[1]),
+        'presion': not (RANGO_PRESION[0] <= presion <= RANGO_PRESION[1])
+    }
+
+def variables_en_alerta(alertas):
+    # Texto con las variables fuera de rango, p. ej. "temperatura, presión"
+    return ", ".join(NOMBRES_VARIABLES[variable] for variable, activa in alertas.items() if activa)
+
+# Estilos de los paneles que se reutilizan en cada actualización
+ESTILO_VALOR_NORMAL = "color: black; font-weight: bold;"
+ESTILO_VALOR_ALERTA = "color: red; font-weight: bold;"
+ESTILO_INDICADOR_OK = f"""
+    background-color: {COLOR_OK};
+    border-radius: 7px;
+"""
+ESTILO_INDICADOR_ALERTA = f"""
+    background-color: {COLOR_ALERTA};
+    border-radius: 7px;
+"""
+
+# Estilos de los indicadores de la pestaña de visualización
+ESTILO_ESTADO_OK = f"""
+    background-color: {COLOR_OK};
+    border-radius: 10px;
+"""
+ESTILO_ESTADO_ALERTA = f"""
+    background-color: {COLOR_ALERTA};
+    border-radius: 10px;
+"""
+ESTILO_INDICADOR_VALOR_OK = """
+    background-color: white;
+    border: 1px solid #ccc;
+    border-radius: 3px;
+    padding: 5px;
+    color: black;
+    min-width: 80px;
+"""
+ESTILO_INDICADOR_VALOR_ALERTA = f"""
+    background-color: white;
+    border: 1px solid #ccc;
+    border-radius: 3px;
+    padding: 5px;
+    color: {COLOR_ALERTA};
+    font-weight: bold;
+    min-width: 80px;
+"""
+
+# Intervalo de repintado de la vista general (un cuadro)
+INTERVALO_CUADRO_MS = 50
+
+# Muestreo adaptativo (segundos): rápido para quirófanos en uso, cerca de un límite o con
+# valores que fluctúan; los quirófanos libres y estables se espacian progresivamente
+INTERVALO_BASE = 2.0
+INTERVALO_RAPIDO = 0.5
+INTERVALO_REPOSO_MIN = 10.0
+INTERVALO_REPOSO_MAX = 30.0
+
+# Distancia a los límites del rango que se considera "cerca del límite"
+MARGEN_LIMITE = {'temperatura': 1.0, 'humedad': 5.0, 'presion': 2.0}
+
+# Variación entre muestras consecutivas (normalizada a INTERVALO_BASE) que se considera fluctuación
+UMBRAL_FLUCTUACION = {'temperatura': 0.3, 'humedad': 1.0, 'presion': 0.5}
+MUESTRAS_ESTABILIDAD = 3
+
+def sustituir_ultima_muestra(timestamps):
+    # Con muestreo rápido el historial se diezma: mientras la última muestra esté a menos de
+    # INTERVALO_BASE de la anterior, la lectura nueva la sustituye en lugar de añadirse. Así los
+    # MAX_HISTORIAL registros cubren al menos MAX_HISTORIAL * INTERVALO_BASE segundos
+    return len(timestamps) > 1 and timestamps[-1] - timestamps[-2] < INTERVALO_BASE
+
+# Clase para simular sensores y generar datos (el muestreo lo dirige PlanificadorMuestreo)
+class SensorSimulado(QObject):
     actualizar_datos = pyqtSignal(dict)
+    estado_cambiado = pyqtSignal(bool)
 
     def __init__(self, quirofano_id):
         super().__init__()
         self.quirofano_id = quirofano_id
-        self.running = True
         self.en_uso = False
 
+        # Planificador que muestrea este sensor y el intervalo actual de muestreo
+        self.planificador = None
+        self.intervalo = INTERVALO_BASE
+
+        # Reloj de las lecturas (se sustituye por uno acelerado en las pruebas de larga duración)
+        self.reloj = time.time
+
+        # Los historiales los modifica el hilo de muestreo: quien los lea desde otro hilo debe
+        # usar copiar_historial, que toma este bloqueo para no ver valores y timestamps desalineados
+        self.bloqueo_historial = threading.Lock()
+
         # Inicializar historiales con valores aleatorios dentro del rango
         self.historial_temperatura = []
         self.historial_humedad = []
         self.historial_presion = []
         self.timestamps = []
+        self.historial_fechas = []  # timestamps ya convertidos para el eje de tiempo
 
         # Generar datos iniciales
         for i in range(30):
@@ -46,102 +161,333 @@ class SensorSimulado(QThread):
             self.historial_humedad.append(random.uniform(RANGO_HUMEDAD[0] + 5, RANGO_HUMEDAD[1] - 5))
             self.historial_presion.append(random.uniform(RANGO_PRESION[0] + 2, RANGO_PRESION[1] - 2))
             # Añadir timestamps pasados
-            self.timestamps.append(datetime.now().timestamp() - (30 - i) * 10)
+            self.timestamps.append(self.reloj() - (30 - i) * 10)
+            self.historial_fechas.append(fecha_grafica(self.timestamps[-1]))
+
+    def restaurar(self, estado):
+        # Sustituir los datos iniciales por el estado recuperado tras un reinicio
+        self.en_uso = estado['en_uso']
+        if estado['timestamps']:
+            with self.bloqueo_historial:
+                self.timestamps = list(estado['timestamps'])
+                self.historial_temperatura = list(estado['temperatura'])
+                self.historial_humedad = list(estado['humedad'])
+                self.historial_presion = list(estado['presion'])
+                self.historial_fechas = [fecha_grafica(timestamp) for timestamp in self.timestamps]
+
+    def copiar_historial(self):
+        # Copia coherente de los historiales, con la misma longitud y alineados
+        with self.bloqueo_historial:
+            return {
+                'timestamps': list(self.timestamps),
+                'fechas': list(self.historial_fechas),
+                'temperatura': list(self.historial_temperatura),
+                'humedad': list(self.historial_humedad),
+                'presion': list(self.historial_presion)
+            }
 
-    def run(self):
-        while self.running:
-            # Generar nuevos valores con pequeñas variaciones aleatorias
-            if self.en_uso:
-                # Mayor variabilidad cuando está en uso
-                temp = self.historial_temperatura[-1] + random.uniform(-0.5, 0.5)
-                hum = self.historial_humedad[-1] + random.uniform(-2.0, 2.0)
-                pres = self.historial_presion[-1] + random.uniform(-0.8, 0.8)
+    def ultima_lectura(self):
+        return {
+            'temperatura': self.historial_temperatura[-1],
+            'humedad': self.historial_humedad[-1],
+            'presion': self.historial_presion[-1],
+            'timestamp': self.timestamps[-1],
+            'en_uso': self.en_uso
+        }
+
+    def generar_lectura(self):
+        # Las variaciones están definidas para muestras cada INTERVALO_BASE: con intervalos
+        # irregulares se escalan según el tiempo transcurrido desde la muestra anterior
+        ahora = self.reloj()
+        # (acotado para no dar un salto brusco tras un reinicio que restaura un historial antiguo)
+        factor = min(max(ahora - self.timestamps[-1], 0.0), INTERVALO_REPOSO_MAX) / INTERVALO_BASE
+        escala = math.sqrt(factor)
+
+        # Generar nuevos valores con pequeñas variaciones aleatorias
+        if self.en_uso:
+            # Mayor variabilidad cuando está en uso
+            temp = self.historial_temperatura[-1] + random.uniform(-0.5, 0.5) * escala
+            hum = self.historial_humedad[-1] + random.uniform(-2.0, 2.0) * escala
+            pres = self.historial_presion[-1] + random.uniform(-0.8, 0.8) * escala
+        else:
+            # Menor variabilidad cuando no está en uso
+            temp = self.historial_temperatura[-1] + random.uniform(-0.2, 0.2) * escala
+            hum = self.historial_humedad[-1] + random.uniform(-0.5, 0.5) * escala
+            pres = self.historial_presion[-1] + random.uniform(-0.3, 0.3) * escala
+
+            # Tendencia a volver a valores seguros cuando no está en uso
+            if temp < RANGO_TEMPERATURA[0] + 1:
+                temp += random.uniform(0, 0.3) * escala
+            elif temp > RANGO_TEMPERATURA[1] - 1:
+                temp -= random.uniform(0, 0.3) * escala
+
+            if hum < RANGO_HUMEDAD[0] + 5:
+                hum += random.uniform(0, 1.0) * escala
+            elif hum > RANGO_HUMEDAD[1] - 5:
+                hum -= random.uniform(0, 1.0) * escala
+
+            if pres < RANGO_PRESION[0] + 2:
+                pres += random.uniform(0, 0.5) * escala
+            elif pres > RANGO_PRESION[1] - 2:
+                pres -= random.uniform(0, 0.5) * escala
+
+        # Simular ocasionalmente valores fuera de rango (solo si está en uso)
+        if self.en_uso and random.random() < 0.05 * factor:  # 5% de probabilidad de anomalías por cada 2 s
+            anomalia = random.choice(['temp', 'hum', 'pres'])
+            if anomalia == 'temp':
+                temp = random.choice([
+                    random.uniform(RANGO_TEMPERATURA[0] - 3, RANGO_TEMPERATURA[0] - 0.1),
+                    random.uniform(RANGO_TEMPERATURA[1] + 0.1, RANGO_TEMPERATURA[1] + 3)
+                ])
+            elif anomalia == 'hum':
+                hum = random.choice([
+                    random.uniform(RANGO_HUMEDAD[0] - 10, RANGO_HUMEDAD[0] - 0.1),
+                    random.uniform(RANGO_HUMEDAD[1] + 0.1, RANGO_HUMEDAD[1] + 10)
+                ])
+            elif anomalia == 'pres':
+                pres = random.choice([
+                    random.uniform(RANGO_PRESION[0] - 5, RANGO_PRESION[0] - 0.1),
+                    random.uniform(RANGO_PRESION[1] + 0.1, RANGO_PRESION[1] + 5)
+                ])
+
+        # Actualizar historiales (todo calculado antes, para tener el bloqueo el menor tiempo posible)
+        fecha = fecha_grafica(ahora)
+        with self.bloqueo_historial:
+            if sustituir_ultima_muestra(self.timestamps):
+                self.historial_temperatura[-1] = temp
+                self.historial_humedad[-1] = hum
+                self.historial_presion[-1] = pres
+                self.timestamps[-1] = ahora
+                self.historial_fechas[-1] = fecha
             else:
-                # Menor variabilidad cuando no está en uso
-                temp = self.historial_temperatura[-1] + random.uniform(-0.2, 0.2)
-                hum = self.historial_humedad[-1] + random.uniform(-0.5, 0.5)
-                pres = self.historial_presion[-1] + random.uniform(-0.3, 0.3)
-
-                # Tendencia a volver a valores seguros cuando no está en uso
-                if temp < RANGO_TEMPERATURA[0] + 1:
-                    temp += random.uniform(0, 0.3)
-                elif temp > RANGO_TEMPERATURA[1] - 1:
-                    temp -= random.uniform(0, 0.3)
-
-                if hum < RANGO_HUMEDAD[0] + 5:
-                    hum += random.uniform(0, 1.0)
-                elif hum > RANGO_HUMEDAD[1] - 5:
-                    hum -= random.uniform(0, 1.0)
-
-                if pres < RANGO_PRESION[0] + 2:
-                    pres += random.uniform(0, 0.5)
-                elif pres > RANGO_PRESION[1] - 2:
-                    pres -= random.uniform(0, 0.5)
-
-            # Simular ocasionalmente valores fuera de rango (solo si está en uso)
-            if self.en_uso and random.random() < 0.05:  # 5% de probabilidad de anomalías
-                anomalia = random.choice(['temp', 'hum', 'pres'])
-                if anomalia == 'temp':
-                    temp = random.choice([
-                        random.uniform(RANGO_TEMPERATURA[0] - 3, RANGO_TEMPERATURA[0] - 0.1),
-                        random.uniform(RANGO_TEMPERATURA[1] + 0.1, RANGO_TEMPERATURA[1] + 3)
-                    ])
-                elif anomalia == 'hum':
-                    hum = random.choice([
-                        random.uniform(RANGO_HUMEDAD[0] - 10, RANGO_HUMEDAD[0] - 0.1),
-                        random.uniform(RANGO_HUMEDAD[1] + 0.1, RANGO_HUMEDAD[1] + 10)
-                    ])
-                elif anomalia == 'pres':
-                    pres = random.choice([
-                        random.uniform(RANGO_PRESION[0] - 5, RANGO_PRESION[0] - 0.1),
-                        random.uniform(RANGO_PRESION[1] + 0.1, RANGO_PRESION[1] + 5)
-                    ])
-
-            # Actualizar historiales
-            self.historial_temperatura.append(temp)
-            self.historial_humedad.append(hum)
-            self.historial_presion.append(pres)
-            self.timestamps.append(datetime.now().timestamp())
-
-            # Mantener solo los últimos 60 registros
-            if len(self.historial_temperatura) > 60:
+                self.historial_temperatura.append(temp)
+                self.historial_humedad.append(hum)
+                self.historial_presion.append(pres)
+                self.timestamps.append(ahora)
+                self.historial_fechas.append(fecha)
+
+            # Mantener solo los últimos registros
+            if len(self.historial_temperatura) > MAX_HISTORIAL:
                 self.historial_temperatura.pop(0)
                 self.historial_humedad.pop(0)
                 self.historial_presion.pop(0)
                 self.timestamps.pop(0)
+                self.historial_fechas.pop(0)
+
+        # Datos actualizados para emitir (los historiales se leen del sensor, sin copiarlos)
+        datos = {
+            'temperatura': temp,
+            'humedad': hum,
+            'presion': pres,
+            'timestamp': self.timestamps[-1],
+            'en_uso': self.en_uso
+        }
+        return datos
 
-            # Emitir los datos actualizados
-            datos = {
-                'temperatura': temp,
-                'humedad': hum,
-                'presion': pres,
-                'historial_temperatura': self.historial_temperatura.copy(),
-                'historial_humedad': self.historial_humedad.copy(),
-                'historial_presion': self.historial_presion.copy(),
-                'timestamps': self.timestamps.copy(),
-                'en_uso': self.en_uso
-            }
-            self.actualizar_datos.emit(datos)
+    def intervalo_muestreo(self):
+        # Segundos hasta la próxima muestra según el estado y la estabilidad del quirófano
+        if self.en_uso or self.cerca_de_limite() or self.fluctuando():
+            self.intervalo = INTERVALO_RAPIDO
+        else:
+            # Quirófano libre y estable: espaciar las muestras hasta INTERVALO_REPOSO_MAX
+            self.intervalo = min(max(self.intervalo * 2, INTERVALO_REPOSO_MIN), INTERVALO_REPOSO_MAX)
+        return self.intervalo
+
+    def cerca_de_limite(self):
+        valores = {
+            'temperatura': (self.historial_temperatura[-1], RANGO_TEMPERATURA),
+            'humedad': (self.historial_humedad[-1], RANGO_HUMEDAD),
+            'presion': (self.historial_presion[-1], RANGO_PRESION)
+        }
+        for variable, (valor, rango) in valores.items():
+            if valor < rango[0] + MARGEN_LIMITE[variable] or valor > rango[1] - MARGEN_LIMITE[variable]:
+                return True
+        return False
+
+    def fluctuando(self):
+        # Mayor variación reciente entre muestras, normalizada al intervalo base
+        historiales = {
+            'temperatura': self.historial_temperatura,
+            'humedad': self.historial_humedad,
+            'presion': self.historial_presion
+        }
+        n = min(MUESTRAS_ESTABILIDAD + 1, len(self.timestamps))
+        for i in range(len(self.timestamps) - n + 1, len(self.timestamps)):
+            escala = math.sqrt(max(self.timestamps[i] - self.timestamps[i - 1], 1e-3) / INTERVALO_BASE)
+            for variable, historial in historiales.items():
+                if abs(historial[i] - historial[i - 1]) / escala > UMBRAL_FLUCTUACION[variable]:
+                    return True
+        return False
+
+    def cambiar_estado(self, en_uso):
+        self.en_uso = en_uso
+        self.estado_cambiado.emit(en_uso)
+
+        # Muestrear de inmediato con el nuevo estado
+        if self.planificador is not None:
+            self.planificador.reprogramar(self)
+
+# Hilo único que muestrea todos los sensores según su intervalo adaptativo
+class PlanificadorMuestreo(QThread):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.running = True
+        self.condicion = threading.Condition()
+
+        # Montículo de (instante, turno, sensor); el turno descarta entradas reprogramadas
+        self.cola = []
+        self.turnos = {}
+        self.contador = 0
+
+        # Reloj de la cola (se sustituye por uno acelerado en las pruebas de larga duración)
+        self.reloj = time.monotonic
 
-            # Esperar antes de la próxima actualización (2 segundos)
-            self.msleep(2000)
+    def agregar(self, sensor, retraso=None):
+        sensor.planificador = self
+        # Repartir las primeras muestras para que no coincidan todas
+        if retraso is None:
+            retraso = random.uniform(0, INTERVALO_BASE)
+        self.programar(sensor, retraso)
+
+    def reprogramar(self, sensor):
+        self.programar(sensor, 0.0)
+
+    def programar(self, sensor, retraso):
+        with self.condicion:
+            self.contador += 1
+            self.turnos[sensor] = self.contador
+            heapq.heappush(self.cola, (self.reloj() + retraso, self.contador, sensor))
+            self.condicion.notify()
+
+    def run(self):
+        while True:
+            with self.condicion:
+                while self.running:
+                    if not self.cola:
+                        self.condicion.wait()
+                        continue
+                    instante, turno, sensor = self.cola[0]
+                    espera = instante - self.reloj()
+                    if espera > 0:
+                        self.condicion.wait(espera)
+                        continue
+                    heapq.heappop(self.cola)
+                    if self.turnos.get(sensor) == turno:
+                        break
+                if not self.running:
+                    return
+
+            # Generar y emitir fuera del bloqueo para no frenar a quien reprograma
+            self.muestrear(sensor, turno)
+
+    def muestrear_pendientes(self):
+        # Muestrear en el hilo que llama los sensores que ya tocan, sin arrancar el hilo
+        # (pruebas de larga duración con reloj acelerado)
+        while True:
+            with self.condicion:
+                if not self.cola or self.cola[0][0] > self.reloj():
+                    return
+                instante, turno, sensor = heapq.heappop(self.cola)
+                if self.turnos.get(sensor) != turno:
+                    continue
+            self.muestrear(sensor, turno)
+
+    def muestrear(self, sensor, turno):
+        sensor.actualizar_datos.emit(sensor.generar_lectura())
+        with self.condicion:
+            # Si se reprogramó mientras tanto, la nueva entrada ya está en la cola
+            if self.turnos.get(sensor) == turno:
+                self.contador += 1
+                self.turnos[sensor] = self.contador
+                heapq.heappush(self.cola, (self.reloj() + sensor.intervalo_muestreo(),
+                                           self.contador, sensor))
 
     def detener(self):
-        self.running = False
+        with self.condicion:
+            self.running = False
+            self.condicion.notify()
         self.wait()
 
-    def cambiar_estado(self, en_uso):
-        self.en_uso = en_uso
+# Compositor que agrupa los repintados de una vista en una sola pasada por cuadro. Solo pinta
+# mientras el contenedor se ve y su ventana no está minimizada
+class CompositorRepintado(QObject):
+    def __init__(self, contenedor, intervalo_ms=INTERVALO_CUADRO_MS):
+        super().__init__(contenedor)
+        self.contenedor = contenedor
+        self.ventana = None
+        self.pausado = False
+
+        # Paneles con lecturas pendientes (el dict conserva el orden de llegada)
+        self.pendientes = {}
+
+        # El timer solo corre cuando hay algo que pintar
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(intervalo_ms)
+        self.timer.timeout.connect(self.componer)
+
+        # Mostrar u ocultar el contenedor (p. ej. al cambiar de pestaña) pausa o reanuda el repintado
+        contenedor.installEventFilter(self)
+        self.actualizar_pausa()
+
+    def eventFilter(self, objeto, evento):
+        tipo = evento.type()
+        if tipo in (QEvent.Show, QEvent.Hide) or (objeto is self.ventana and tipo == QEvent.WindowStateChange):
+            self.actualizar_pausa()
+        return False
+
+    def actualizar_pausa(self):
+        # La ventana definitiva solo se conoce cuando el contenedor ya está insertado en ella. El
+        # filtro no se quita de una ventana anterior (puede estar destruyéndose): eventFilter solo
+        # atiende a la actual
+        ventana = self.contenedor.window()
+        if ventana is not self.ventana:
+            self.ventana = ventana
+            if ventana is not self.contenedor:
+                ventana.installEventFilter(self)
+        if self.contenedor.isVisible() and not ventana.isMinimized():
+            self.reanudar()
+        else:
+            self.pausar()
+
+    def marcar(self, panel):
+        self.pendientes[panel] = True
+        if not self.pausado and not self.timer.isActive():
+            self.timer.start()
+
+    def componer(self):
+        if self.pausado or not self.pendientes:
+            return
+        paneles = self.pendientes
+        self.pendientes = {}
+
+        # Solo se invalidan las etiquetas que cambian; Qt agrupa esos update() en un único
+        # repintado por pasada del bucle de eventos (setUpdatesEnabled(True) repintaría todo)
+        for panel in paneles:
+            panel.pintar()
+
+    def pausar(self):
+        self.pausado = True
+        self.timer.stop()
+
+    def reanudar(self):
+        self.pausado = False
+        if self.pendientes and not self.timer.isActive():
+            self.timer.start()
 
 # Canvas personalizado para gráficas
 class GraficaMonitoreo(FigureCanvas):
     def __init__(self, parent=None, width=6, height=4, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi, tight_layout=True)
 
-        # Subfiguras para temperatura, humedad y presión
+        # Subfiguras para temperatura, humedad y presión, con el eje de tiempo compartido
         self.ax1 = self.fig.add_subplot(311)  # Temperatura
-        self.ax2 = self.fig.add_subplot(312)  # Humedad
-        self.ax3 = self.fig.add_subplot(313)  # Presión
+        self.ax2 = self.fig.add_subplot(312, sharex=self.ax1)  # Humedad
+        self.ax3 = self.fig.add_subplot(313, sharex=self.ax1)  # Presión
+
+        # Eje de tiempo en fechas de matplotlib: localizador y formato se configuran una sola vez
+        self.ax1.xaxis.set_major_locator(mdates.AutoDateLocator())
+        self.ax1.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
 
         # Configuración visual de los ejes
         for ax in [self.ax1, self.ax2, self.ax3]:
@@ -180,36 +526,44 @@ class GraficaMonitoreo(FigureCanvas):
         self.ax2.set_ylim(RANGO_HUMEDAD[0] - 15, RANGO_HUMEDAD[1] + 15)
         self.ax3.set_ylim(RANGO_PRESION[0] - 7, RANGO_PRESION[1] + 7)
 
-    def actualizar_datos(self, timestamps, temp, hum, pres):
-        # Convertir timestamps a datetime para el eje x
-        fechas = [datetime.fromtimestamp(ts) for ts in timestamps]
+    def actualizar_datos(self, fechas, temp, hum, pres):
+        # Las fechas llegan ya convertidas (fecha_grafica) y ordenadas de la más antigua a la más nueva
 
         # Actualizar datos en las gráficas
         self.line_temp.set_data(fechas, temp)
         self.line_hum.set_data(fechas, hum)
         self.line_pres.set_data(fechas, pres)
 
-        # Ajustar límites del eje x automáticamente
-        for ax in [self.ax1, self.ax2, self.ax3]:
-            ax.set_xlim(min(fechas), max(fechas))
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        # Ajustar el eje x compartido a la ventana de datos
+        if len(fechas) > 1:
+            self.ax1.set_xlim(fechas[0], fechas[-1])
 
         # Actualizar el lienzo
         self.fig.canvas.draw()
 
 # Panel que muestra el estado de un quirófano
 class PanelQuirofano(QFrame):
-    def __init__(self, quirofano_id, parent=None, ventana_principal=None):
+    def __init__(self, quirofano_id, parent=None, ventana_principal=None, compositor=None, sensor=None):
         super().__init__(parent)
         self.quirofano_id = quirofano_id
         self.en_uso = False
         self.alertas_activas = {'temperatura': False, 'humedad': False, 'presion': False}
+        self.variables_alarma = "" # Variables de la alarma en curso, vacío si no hay alarma
         self.ventana_principal = ventana_principal # Referencia a la ventana principal
-
-        # Crear sensor simulado
-        self.sensor = SensorSimulado(quirofano_id)
+        self.compositor = compositor # Agrupa los repintados de la vista general
+
+        # Última lectura pendiente de pintar y lo que muestran las etiquetas
+        self.datos_pendientes = None
+        self.textos_mostrados = {'temperatura': None, 'humedad': None, 'presion': None}
+        self.alertas_mostradas = {'temperatura': None, 'humedad': None, 'presion': None}
+        self.alerta_indicador = False
+
+        # Usar el sensor recibido (p. ej. remoto) o crear uno simulado propio
+        if sensor is None:
+            sensor = SensorSimulado(quirofano_id)
+        self.sensor = sensor
         self.sensor.actualizar_datos.connect(self.actualizar_panel)
-        self.sensor.start()
+        self.sensor.estado_cambiado.connect(self.mostrar_estado)
 
         # Configurar apariencia del marco
         self.setFrameShape(QFrame.StyledPanel)
@@ -288,15 +642,18 @@ class PanelQuirofano(QFrame):
 
         layout.addLayout(variables_layout)
 
+        self.etiquetas_variables = {
+            'temperatura': self.lbl_temperatura,
+            'humedad': self.lbl_humedad,
+            'presion': self.lbl_presion
+        }
+
         # Círculo indicador de estado general
         self.indicador_layout = QHBoxLayout()
         self.indicador_layout.addStretch()
         self.lbl_indicador = QLabel()
         self.lbl_indicador.setFixedSize(15, 15)
-        self.lbl_indicador.setStyleSheet(f"""
-            background-color: {COLOR_OK};
-            border-radius: 7px;
-        """)
+        self.lbl_indicador.setStyleSheet(ESTILO_INDICADOR_OK)
         self.indicador_layout.addWidget(self.lbl_indicador)
         self.indicador_layout.addStretch()
         layout.addLayout(self.indicador_layout)
@@ -306,7 +663,15 @@ class PanelQuirofano(QFrame):
         layout.setSpacing(8)
 
     def cambiar_estado(self):
-        self.en_uso = self.btn_cambiar_estado.isChecked()
+        en_uso = self.btn_cambiar_estado.isChecked()
+        self.mostrar_estado(en_uso)
+
+        # Actualizar sensor
+        self.sensor.cambiar_estado(en_uso)
+
+    def mostrar_estado(self, en_uso):
+        self.en_uso = en_uso
+        self.btn_cambiar_estado.setChecked(en_uso)
         if self.en_uso:
             self.lbl_estado.setText("En uso")
             self.lbl_estado.setStyleSheet(f"font-weight: bold; color: {COLOR_ALERTA};")
@@ -316,65 +681,67 @@ class PanelQuirofano(QFrame):
             self.lbl_estado.setStyleSheet(f"font-weight: bold; color: {COLOR_OK};")
             self.btn_cambiar_estado.setText("En uso")
 
-        # Actualizar sensor
-        self.sensor.cambiar_estado(self.en_uso)
-
     def actualizar_panel(self, datos):
         temperatura = datos['temperatura']
         humedad = datos['humedad']
         presion = datos['presion']
 
-        # Formatear valores con 1 decimal
-        self.lbl_temperatura.setText(f"{temperatura:.1f} °C")
-        self.lbl_humedad.setText(f"{humedad:.1f} %")
-        self.lbl_presion.setText(f"{presion:.1f} Pa")
+        # Verificar rangos
+        self.alertas_activas = evaluar_alertas(temperatura, humedad, presion)
+
+        # Mostrar alerta si hay algún problema (no se retrasa hasta el repintado)
+        en_alarma = self.en_uso and any(self.alertas_activas.values())
+        variables = variables_en_alerta(self.alertas_activas) if en_alarma else ""
+        # Usar la referencia a la ventana principal para mostrar la alerta, solo al entrar en
+        # alarma o cuando cambian las variables fuera de rango
+        if self.ventana_principal:
+            if variables != self.variables_alarma:
+                if variables:
+                    self.ventana_principal.mostrar_alerta(self.quirofano_id, variables)
+                else:
+                    self.ventana_principal.fin_alerta(self.quirofano_id)
+            elif variables:
+                self.ventana_principal.seguir_alerta(self.quirofano_id, variables)
+        self.variables_alarma = variables
+
+        # Guardar la última lectura y repintar en el próximo cuadro
+        self.datos_pendientes = datos
+        if self.compositor:
+            self.compositor.marcar(self)
+        else:
+            self.pintar()
 
-        # Verificar rangos y actualizar colores
-        self.alertas_activas = {
-            'temperatura': not (RANGO_TEMPERATURA[0] <= temperatura <= RANGO_TEMPERATURA[1]),
-            'humedad': not (RANGO_HUMEDAD[0] <= humedad <= RANGO_HUMEDAD[1]),
-            'presion': not (RANGO_PRESION[0] <= presion <= RANGO_PRESION[1])
-        }
+    def pintar(self):
+        datos = self.datos_pendientes
+        if datos is None:
+            return
+        self.datos_pendientes = None
 
-        # Actualizar color de los valores
-        self.lbl_temperatura.setStyleSheet(
-            f"color: {'red' if self.alertas_activas['temperatura'] else 'black'}; font-weight: bold;"
-        )
-        self.lbl_humedad.setStyleSheet(
-            f"color: {'red' if self.alertas_activas['humedad'] else 'black'}; font-weight: bold;"
-        )
-        self.lbl_presion.setStyleSheet(
-            f"color: {'red' if self.alertas_activas['presion'] else 'black'}; font-weight: bold;"
-        )
+        # Formatear valores con 1 decimal y tocar solo las etiquetas que cambian
+        textos = {
+            'temperatura': f"{datos['temperatura']:.1f} °C",
+            'humedad': f"{datos['humedad']:.1f} %",
+            'presion': f"{datos['presion']:.1f} Pa"
+        }
+        for variable, texto in textos.items():
+            etiqueta = self.etiquetas_variables[variable]
+            if self.textos_mostrados[variable] != texto:
+                etiqueta.setText(texto)
+                self.textos_mostrados[variable] = texto
+
+            # Actualizar color del valor
+            alerta = self.alertas_activas[variable]
+            if self.alertas_mostradas[variable] != alerta:
+                etiqueta.setStyleSheet(ESTILO_VALOR_ALERTA if alerta else ESTILO_VALOR_NORMAL)
+                self.alertas_mostradas[variable] = alerta
 
         # Actualizar indicador general
-        if any(self.alertas_activas.values()):
-            self.lbl_indicador.setStyleSheet(f"""
-                background-color: {COLOR_ALERTA};
-                border-radius: 7px;
-            """)
-
-            # Mostrar alerta si hay algún problema
-            if self.en_uso and any(self.alertas_activas.values()):
-                variables_problema = []
-                if self.alertas_activas['temperatura']:
-                    variables_problema.append("temperatura")
-                if self.alertas_activas['humedad']:
-                    variables_problema.append("humedad")
-                if self.alertas_activas['presion']:
-                    variables_problema.append("presión")
-
-                # Usar la referencia a la ventana principal para mostrar la alerta
-                if self.ventana_principal:
-                    self.ventana_principal.mostrar_alerta(
-                        self.quirofano_id,
-                        ", ".join(variables_problema)
-                    )
-        else:
-            self.lbl_indicador.setStyleSheet(f"""
-                background-color: {COLOR_OK};
-                border-radius: 7px;
-            """)
+        alerta_general = any(self.alertas_activas.values())
+        if self.alerta_indicador != alerta_general:
+            self.lbl_indicador.setStyleSheet(
+                ESTILO_INDICADOR_ALERTA if alerta_general else ESTILO_INDICADOR_OK
+            )
+            self.alerta_indicador = alerta_general
 
 # Pestaña de visualización detallada
 class PestañaVisualizacion(QWidget):
@@ -437,9 +804,8 @@ class PestañaVisualizacion(QWidget):
 
         # Selector de quirófano
         control_layout.addWidget(QLabel("Seleccionar Quirófano:"))
+        # Las opciones se cargan al asignar los paneles de quirófanos
         self.combo_quirofano = QComboBox()
-        self.combo_quirofano.addItems([f"Quirófano {i+1}" for i in range(6)])
-        self.combo_quirofano.setCurrentIndex(0)
         self.combo_quirofano.currentIndexChanged.connect(self.cambiar_quirofano)
         self.combo_quirofano.setStyleSheet(f"""
             QComboBox {{
@@ -613,6 +979,13 @@ class PestañaVisualizacion(QWidget):
     def set_paneles_quirofano(self, paneles):
         self.paneles_quirofano = paneles
 
+        # Cargar el selector sin disparar cambios intermedios
+        self.combo_quirofano.blockSignals(True)
+        self.combo_quirofano.clear()
+        self.combo_quirofano.addItems([f"Quirófano {panel.quirofano_id}" for panel in paneles])
+        self.combo_quirofano.setCurrentIndex(0)
+        self.combo_quirofano.blockSignals(False)
+
     def actualizar_datetime(self):
         ahora = datetime.now()
         self.lbl_datetime.setText(ahora.strftime("%d/%m/%Y %H:%M:%S"))
@@ -646,14 +1019,15 @@ class PestañaVisualizacion(QWidget):
         panel = self.paneles_quirofano[self.quirofano_actual]
         sensor = panel.sensor
 
-        # Obtener datos actuales
-        timestamps = sensor.timestamps
-        temp = sensor.historial_temperatura
-        hum = sensor.historial_humedad
-        pres = sensor.historial_presion
+        # Los historiales los modifica el hilo de muestreo: trabajar sobre una copia coherente
+        historial = sensor.copiar_historial()
+        fechas = historial['fechas']
+        temp = historial['temperatura']
+        hum = historial['humedad']
+        pres = historial['presion']
 
         # Actualizar gráficas
-        self.canvas.actualizar_datos(timestamps, temp, hum, pres)
+        self.canvas.actualizar_datos(fechas, temp, hum, pres)
 
         # Actualizar indicadores
         if len(temp) > 0:
@@ -677,37 +1051,16 @@ class PestañaVisualizacion(QWidget):
 
         if rango[0] <= valor <= rango[1]:
             # Valor dentro del rango
-            estado_label.setStyleSheet(f"""
-                background-color: {COLOR_OK};
-                border-radius: 10px;
-            """)
-            valor_label.setStyleSheet(f"""
-                background-color: white;
-                border: 1px solid #ccc;
-                border-radius: 3px;
-                padding: 5px;
-                color: black;
-                min-width: 80px;
-            """)
+            estado_label.setStyleSheet(ESTILO_ESTADO_OK)
+            valor_label.setStyleSheet(ESTILO_INDICADOR_VALOR_OK)
         else:
             # Valor fuera del rango
-            estado_label.setStyleSheet(f"""
-                background-color: {COLOR_ALERTA};
-                border-radius: 10px;
-            """)
-            valor_label.setStyleSheet(f"""
-                background-color: white;
-                border: 1px solid #ccc;
-                border-radius: 3px;
-                padding: 5px;
-                color: {COLOR_ALERTA};
-                font-weight: bold;
-                min-width: 80px;
-            """)
+            estado_label.setStyleSheet(ESTILO_ESTADO_ALERTA)
+            valor_label.setStyleSheet(ESTILO_INDICADOR_VALOR_ALERTA)
 
 # Pestaña con la vista general de todos los quirófanos
 class PestañaGeneral(QWidget):
-    def __init__(self, ventana_principal, parent=None):
+    def __init__(self, ventana_principal, parent=None, num_quirofanos=NUM_QUIROFANOS, sensores=None):
         super().__init__(parent)
         self.ventana_principal = ventana_principal # Guardar referencia
         # Layout principal
@@ -724,17 +1077,31 @@ class PestañaGeneral(QWidget):
         grid_layout = QGridLayout()
         grid_layout.setSpacing(15)
 
-        # Crear paneles para 6 quirófanos
+        # Los paneles se repintan juntos, una vez por cuadro
+        self.compositor = CompositorRepintado(self)
+
+        # Sin sensores externos, cada panel crea su propio sensor simulado
+        sensores_locales = sensores is None
+        if sensores_locales:
+            sensores = [None] * num_quirofanos
+
+        # Un único hilo muestrea todos los sensores simulados (se inicia desde la ventana)
+        self.planificador = PlanificadorMuestreo(self)
+
+        # Crear paneles para los quirófanos
         self.paneles_quirofano = []
-        for i in range(6):
-            fila = i // 3
-            col = i % 3
+        for i, sensor in enumerate(sensores):
+            fila = i // COLUMNAS_QUIROFANOS
+            col = i % COLUMNAS_QUIROFANOS
+            quirofano_id = sensor.quirofano_id if sensor is not None else i + 1
             # Pasar la referencia a la ventana principal al crear PanelQuirofano
-            panel = PanelQuirofano(i+1, self, self.ventana_principal)
+            panel = PanelQuirofano(quirofano_id, self, self.ventana_principal, self.compositor, sensor)
             grid_layout.addWidget(panel, fila, col)
 
             # Guardar referencia al panel
             self.paneles_quirofano.append(panel)
+            if sensores_locales:
+                self.planificador.agregar(panel.sensor)
 
         layout.addLayout(grid_layout)
 
@@ -779,16 +1146,20 @@ class PestañaGeneral(QWidget):
         layout.setStretch(1, 3)  # Grid de quirófanos
         layout.setStretch(2, 1)  # Panel de alertas
 
-    def mostrar_alerta(self, quirofano_id, variables):
-        # Crear mensaje de alerta
-        timestamp = datetime.now().strftime("%H:%M:%S")
+    def limpiar_alertas(self):
+        self.historial_alertas.clear()
+        self.lista_alertas.setText("<p><i>No hay alertas recientes</i></p>")
+
+    def mostrar_alerta(self, quirofano_id, variables, hora=None):
+        # Crear mensaje de alerta (la hora se recibe ya formateada al reproducir alertas pasadas)
+        timestamp = hora or datetime.now().strftime("%H:%M:%S")
         mensaje = f"<p><b>[{timestamp}]</b> <font color='{COLOR_ALERTA}'>Alerta</font> - <b>Quirófano {quirofano_id}</b>: Variables fuera de rango: {variables}</p>"
 
         # Añadir al historial
         self.historial_alertas.insert(0, mensaje)
 
-        # Mantener solo las últimas 10 alertas
-        if len(self.historial_alertas) > 10:
+        # Mantener solo las últimas alertas
+        if len(self.historial_alertas) > MAX_ALERTAS:
             self.historial_alertas.pop()
 
         # Actualizar la lista mostrada
@@ -797,10 +1168,126 @@ class PestañaGeneral(QWidget):
         else:
             self.lista_alertas.setText("<p><i>No hay alertas recientes</i></p>")
 
+# Pestaña con los quirófanos agrupados por planta y ala
+class PestañaAgrupacion(QWidget):
+    # Columnas del árbol
+    COLUMNA_NOMBRE = 0
+    COLUMNA_ALARMA = 1
+    COLUMNAS_VARIABLES = {'temperatura': 2, 'humedad': 3, 'presion': 4}
+    COLUMNA_PRESION_MEDIA = 5
+    UNIDADES = {'temperatura': "°C", 'humedad': "%", 'presion': "Pa"}
+    COLOR_TEXTO_NORMAL = QColor(COLOR_PRINCIPAL)
+    COLOR_TEXTO_ALERTA = QColor(COLOR_ALERTA)
+
+    def __init__(self, ventana_principal, paneles_quirofano, parent=None):
+        super().__init__(parent)
+        self.ventana_principal = ventana_principal
+
+        # Modelo con los agregados de cada grupo
+        rangos = {'temperatura': RANGO_TEMPERATURA, 'humedad': RANGO_HUMEDAD, 'presion': RANGO_PRESION}
+        self.modelo = ModeloAgrupacion([panel.quirofano_id for panel in paneles_quirofano], rangos)
+
+        # Layout principal
+        layout = QVBoxLayout(self)
+
+        # Título
+        titulo = QLabel("Vista por Plantas y Alas")
+        titulo.setFont(QFont("Arial", 16, QFont.Bold))
+        titulo.setAlignment(Qt.AlignCenter)
+        titulo.setStyleSheet(f"color: {COLOR_PRINCIPAL}; margin-bottom: 10px;")
+        layout.addWidget(titulo)
+
+        # Árbol hospital -> planta -> ala -> quirófano
+        self.arbol = QTreeWidget()
+        self.arbol.setHeaderLabels(["Ubicación", "En alarma", "Peor temperatura",
+                                    "Peor humedad", "Peor presión", "Presión media"])
+        self.arbol.setStyleSheet("background-color: white;")
+        self.arbol.itemDoubleClicked.connect(self.abrir_quirofano)
+        layout.addWidget(self.arbol)
+
+        # Crear los elementos una sola vez; después solo se actualizan los que cambian
+        self.items_grupo = {}
+        self.items_quirofano = {}
+        self.alarmas_mostradas = {}
+        for grupo in self.modelo.grupos():
+            padre = self.items_grupo.get(grupo.padre, self.arbol)
+            item = QTreeWidgetItem(padre, [grupo.nombre])
+            self.items_grupo[grupo] = item
+            for quirofano_id in grupo.quirofanos:
+                item_quirofano = QTreeWidgetItem(item, [f"Quirófano {quirofano_id}"])
+                item_quirofano.setData(self.COLUMNA_NOMBRE, Qt.UserRole, quirofano_id)
+                self.items_quirofano[quirofano_id] = item_quirofano
+            self.pintar_grupo(grupo)
+        self.items_grupo[self.modelo.raiz].setExpanded(True)
+        for columna in range(self.arbol.columnCount()):
+            self.arbol.resizeColumnToContents(columna)
+
+        # Las lecturas llegan directamente de los sensores
+        for panel in paneles_quirofano:
+            panel.sensor.actualizar_datos.connect(self.actualizar_quirofano)
+
+        # Repintar una vez por cuadro y solo mientras la pestaña se ve
+        self.compositor = CompositorRepintado(self)
+
+    @pyqtSlot(dict)
+    def actualizar_quirofano(self, datos):
+        quirofano_id = self.sender().quirofano_id
+        self.modelo.actualizar(quirofano_id, datos['temperatura'], datos['humedad'], datos['presion'])
+        self.compositor.marcar(self)
+
+    def pintar(self):
+        # Solo los quirófanos que cambiaron y sus grupos antecesores
+        quirofanos, grupos = self.modelo.tomar_cambios()
+        for quirofano_id in quirofanos:
+            self.pintar_quirofano(quirofano_id)
+        for grupo in grupos:
+            self.pintar_grupo(grupo)
+
+    def pintar_quirofano(self, quirofano_id):
+        # Una lectura nueva suele dar el mismo texto con un decimal: tocar solo lo que cambia
+        item = self.items_quirofano[quirofano_id]
+        valores = self.modelo.lecturas[quirofano_id]
+        alarma = self.modelo.en_alarma[quirofano_id]
+        textos = [(self.COLUMNA_ALARMA, "Sí" if alarma else "No")]
+        textos.extend((self.COLUMNAS_VARIABLES[variable], f"{valores[variable]:.1f} {self.UNIDADES[variable]}")
+                      for variable in VARIABLES)
+        for columna, texto in textos:
+            if item.text(columna) != texto:
+                item.setText(columna, texto)
+        if self.alarmas_mostradas.get(quirofano_id) != alarma:
+            item.setForeground(self.COLUMNA_ALARMA, self.COLOR_TEXTO_ALERTA if alarma else self.COLOR_TEXTO_NORMAL)
+            self.alarmas_mostradas[quirofano_id] = alarma
+
+    def pintar_grupo(self, grupo):
+        item = self.items_grupo[grupo]
+        item.setText(self.COLUMNA_ALARMA, f"{grupo.en_alarma} / {grupo.num_quirofanos}")
+        item.setForeground(self.COLUMNA_ALARMA, self.COLOR_TEXTO_ALERTA if grupo.en_alarma else self.COLOR_TEXTO_NORMAL)
+        for variable in VARIABLES:
+            columna = self.COLUMNAS_VARIABLES[variable]
+            peor = grupo.peor(variable)
+            if peor is None:
+                item.setText(columna, "--")
+                continue
+            quirofano_id, severidad = peor
+            valor = self.modelo.lecturas[quirofano_id][variable]
+            item.setText(columna, f"Q{quirofano_id}: {valor:.1f} {self.UNIDADES[variable]}")
+            item.setForeground(columna, self.COLOR_TEXTO_ALERTA if severidad > 0 else self.COLOR_TEXTO_NORMAL)
+        media = grupo.presion_media()
+        item.setText(self.COLUMNA_PRESION_MEDIA, "--" if media is None else f"{media:.1f} Pa")
+
+    def abrir_quirofano(self, item, columna):
+        # Doble clic en un quirófano: abrir su visualización detallada
+        quirofano_id = item.data(self.COLUMNA_NOMBRE, Qt.UserRole)
+        if quirofano_id is None:
+            return
+        self.ventana_principal.abrir_visualizacion(quirofano_id)
+
 # Ventana principal
 class VentanaPrincipal(QMainWindow):
-    def __init__(self):
+    def __init__(self, num_quirofanos=NUM_QUIROFANOS, sensores=None, despachador=None, persistencia=None):
         super().__init__()
+        self.despachador = despachador # Envía las alertas a sistemas externos
+        self.persistencia = persistencia # Checkpoint y WAL para reiniciar sin perder el estado
 
         # Configurar ventana
         self.setWindowTitle("Sistema de Control de Infecciones en Quirófanos")
@@ -843,22 +1330,125 @@ class VentanaPrincipal(QMainWindow):
         main_layout.addWidget(self.tabs)
 
         # Crear pestañas
-        self.pestaña_general = PestañaGeneral(self) # Pasar la instancia de VentanaPrincipal
+        self.pestaña_general = PestañaGeneral(self, num_quirofanos=num_quirofanos, sensores=sensores) # Pasar la instancia de VentanaPrincipal
+        self.pestaña_agrupacion = PestañaAgrupacion(self, self.pestaña_general.paneles_quirofano)
         self.pestaña_visualizacion = PestañaVisualizacion(self)
 
         # Añadir pestañas al tab widget
         self.tabs.addTab(self.pestaña_general, "Vista General")
+        self.tabs.addTab(self.pestaña_agrupacion, "Vista por Plantas")
         self.tabs.addTab(self.pestaña_visualizacion, "Visualización Detallada")
 
         # Pasar la referencia de los paneles de quirófano a la pestaña de visualización
         self.pestaña_visualizacion.set_paneles_quirofano(self.pestaña_general.paneles_quirofano)
 
-    def mostrar_alerta(self, quirofano_id, variables):
+        # Recuperar el estado anterior antes de generar lecturas nuevas
+        if self.persistencia is not None:
+            self.restaurar_estado()
+
+        # Empezar a muestrear cuando todas las vistas están conectadas a los sensores
+        self.pestaña_general.planificador.start()
+
+    def restaurar_estado(self):
+        estados, alertas = self.persistencia.cargar()
+        modelo = self.pestaña_agrupacion.modelo
+        for panel in self.pestaña_general.paneles_quirofano:
+            estado = estados.get(panel.quirofano_id)
+            if estado is not None:
+                panel.sensor.restaurar(estado)
+                panel.mostrar_estado(panel.sensor.en_uso)
+                if estado['timestamps']:
+                    # Mostrar la última lectura sin volver a generar sus alertas
+                    datos = panel.sensor.ultima_lectura()
+                    panel.alertas_activas = evaluar_alertas(datos['temperatura'], datos['humedad'], datos['presion'])
+                    if panel.en_uso and any(panel.alertas_activas.values()):
+                        panel.variables_alarma = variables_en_alerta(panel.alertas_activas)
+                    panel.datos_pendientes = datos
+                    panel.pintar()
+                    modelo.actualizar(panel.quirofano_id, datos['temperatura'], datos['humedad'], datos['presion'])
+            self.persistencia.registrar_sensor(panel.sensor)
+        self.pestaña_agrupacion.pintar()
+
+        # Las alertas recuperadas ya se notificaron antes del reinicio
+        for alerta in alertas:
+            self.pestaña_general.mostrar_alerta(alerta['id'], alerta['variables'], alerta['hora'])
+
+        self.persistencia.iniciar()
+
+    def mostrar_alerta(self, quirofano_id, variables, hora=None):
         # Llama al método de la pestaña general para mostrar la alerta
-        self.pestaña_general.mostrar_alerta(quirofano_id, variables)
+        hora = hora or datetime.now().strftime("%H:%M:%S")
+        self.pestaña_general.mostrar_alerta(quirofano_id, variables, hora)
+        if self.persistencia is not None:
+            self.persistencia.registrar_alerta(quirofano_id, variables, hora, time.time())
+
+        # Notificar fuera de la ventana sin esperar a los sumideros (solo los cambios de alarma)
+        if self.despachador is not None:
+            self.despachador.actualizar_alarma(quirofano_id, variables, hora)
+
+    def seguir_alerta(self, quirofano_id, variables):
+        # La alarma sigue activa sin cambios: no se añade a la lista, pero el despachador puede
+        # tener que volver a notificarla (--renotificar)
+        if self.despachador is not None:
+            self.despachador.actualizar_alarma(quirofano_id, variables)
+
+    def fin_alerta(self, quirofano_id):
+        # El quirófano ha vuelto al rango: la próxima alarma se notificará de nuevo
+        if self.despachador is not None:
+            self.despachador.actualizar_alarma(quirofano_id, None)
+
+    def abrir_visualizacion(self, quirofano_id):
+        # Mostrar la pestaña de visualización con el quirófano indicado
+        for i, panel in enumerate(self.pestaña_general.paneles_quirofano):
+            if panel.quirofano_id == quirofano_id:
+                self.pestaña_visualizacion.combo_quirofano.setCurrentIndex(i)
+                break
+        self.tabs.setCurrentWidget(self.pestaña_visualizacion)
+
+    def detener_sensores(self):
+        self.pestaña_general.planificador.detener()
+        if self.persistencia is not None:
+            self.persistencia.cerrar()
+
+    def closeEvent(self, event):
+        self.detener_sensores()
+        super().closeEvent(event)
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    ventana = VentanaPrincipal()
+    import logging
+    from notificaciones_quirofanos import DespachadorNotificaciones, sumideros_configurados
+    from memoria_quirofanos import MonitorMemoria, INTERVALO_INFORME
+    from persistencia_quirofanos import PersistenciaQuirofanos, DIRECTORIO_ESTADO
+
+    parser = argparse.ArgumentParser(description="Sistema de Control de Infecciones en Quirófanos")
+    parser.add_argument("--quirofanos", type=int, default=NUM_QUIROFANOS, help="número de quirófanos")
+    parser.add_argument("--larga-duracion", action="store_true",
+                        help="informar periódicamente del uso de memoria (pantallas 24/7)")
+    parser.add_argument("--intervalo-memoria", type=int, default=INTERVALO_INFORME,
+                        help="segundos entre informes de memoria")
+    parser.add_argument("--renotificar", type=float,
+                        help="segundos tras los que se vuelve a notificar una alarma que sigue activa")
+    parser.add_argument("--estado", default=os.path.join(DIRECTORIO_ESTADO, "ventana"),
+                        help="directorio del checkpoint y del WAL para reiniciar sin perder el estado")
+    parser.add_argument("--sin-estado", action="store_true", help="no guardar ni restaurar el estado")
+    # Los argumentos restantes son para Qt
+    args, argumentos_qt = parser.parse_known_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    app = QApplication(sys.argv[:1] + argumentos_qt)
+    monitor = None
+    if args.larga_duracion:
+        monitor = MonitorMemoria(args.intervalo_memoria)
+        monitor.iniciar()
+    despachador = DespachadorNotificaciones(sumideros_configurados(), args.renotificar)
+    despachador.iniciar()
+    persistencia = None
+    if not args.sin_estado:
+        persistencia = PersistenciaQuirofanos(args.estado, MAX_HISTORIAL, MAX_ALERTAS, INTERVALO_BASE)
+    ventana = VentanaPrincipal(num_quirofanos=args.quirofanos, despachador=despachador, persistencia=persistencia)
     ventana.show()
-    sys.exit(app.exec_())
+    codigo = app.exec_()
+    despachador.detener()
+    if monitor is not None:
+        monitor.detener()
+    sys.exit(codigo)
@@ -0,0 +1,86 @@
+# Seguimiento de memoria para las ejecuciones de larga duración (pantallas que funcionan
+# semanas sin reiniciarse): informa periódicamente del RSS del proceso, de los mayores
+# asignadores de memoria y de lo que más ha crecido desde el informe anterior.
+import os
+import sys
+import logging
+import threading
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se genera un informe (segundos) y cuántas líneas se muestran
+INTERVALO_INFORME = 600
+LINEAS_INFORME = 10
+
+def rss_actual():
+    # Memoria residente actual en bytes (Linux); en otros sistemas, el pico de RSS
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+        except ImportError:
+            return 0
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en bytes en macOS y en KiB en el resto
+        return pico if sys.platform == "darwin" else pico * 1024
+
+class MonitorMemoria:
+    def __init__(self, intervalo=INTERVALO_INFORME, lineas=LINEAS_INFORME, marcos=1):
+        self.intervalo = intervalo
+        self.lineas = lineas
+        self.marcos = marcos
+        self.anterior = None
+        self.rss_inicial = None
+        self.detenido = threading.Event()
+        self.hilo = None
+
+    def iniciar(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.marcos)
+        self.rss_inicial = rss_actual()
+        self.anterior = self.tomar_snapshot()
+        self.hilo = threading.Thread(target=self._ejecutar, name="MonitorMemoria", daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.detenido.set()
+        if self.hilo is not None:
+            self.hilo.join()
+        tracemalloc.stop()
+
+    def tomar_snapshot(self):
+        # Ignorar las asignaciones del propio tracemalloc
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def informe(self):
+        snapshot = self.tomar_snapshot()
+        actual, pico = tracemalloc.get_traced_memory()
+        rss = rss_actual()
+
+        lineas = [
+            f"RSS {rss / 2**20:.1f} MiB ({(rss - self.rss_inicial) / 2**20:+.1f} MiB desde el inicio), "
+            f"Python {actual / 2**20:.1f} MiB (pico {pico / 2**20:.1f} MiB)",
+            "Mayores asignadores:"
+        ]
+        for estadistica in snapshot.statistics("lineno")[:self.lineas]:
+            lineas.append(f"  {estadistica}")
+
+        lineas.append("Mayor crecimiento desde el informe anterior:")
+        for diferencia in snapshot.compare_to(self.anterior, "lineno")[:self.lineas]:
+            if diferencia.size_diff <= 0:
+                break
+            lineas.append(f"  {diferencia}")
+
+        self.anterior = snapshot
+        return "\n".join(lineas)
+
+    def _ejecutar(self):
+        while not self.detenido.wait(self.intervalo):
+            logger.info("Informe de memoria:\n%s", self.informe())
@@ -0,0 +1,322 @@
+# Despacho de alertas a sistemas externos (buscapersonas, correo, pasarela de mensajería).
+#
+# Los sumideros externos son lentos y pueden bloquearse, así que el despacho corre en un
+# bucle asyncio en su propio hilo. Cada sumidero tiene una cola acotada: las alertas que
+# llegan juntas se envían en un mismo lote, los envíos fallidos se reintentan con espera
+# exponencial y, si la cola se llena, se descarta la alerta de menor prioridad. Publicar
+# una alerta desde la interfaz o desde los sensores nunca espera a un sumidero.
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import smtplib
+import threading
+import urllib.request
+from collections import deque
+from datetime import datetime
+from email.message import EmailMessage
+
+logger = logging.getLogger(__name__)
+
+# Alertas publicadas pendientes de pasar al bucle como máximo
+CAPACIDAD_ENTRADA = 1000
+
+# Peso de cada variable en la prioridad de una alerta (la presión diferencial es la más crítica)
+PESO_VARIABLES = {"presión": 3, "temperatura": 2, "humedad": 1}
+
+def prioridad_alerta(variables):
+    # Suma de los pesos de las variables fuera de rango, p. ej. "temperatura, presión" -> 5
+    return sum(PESO_VARIABLES.get(variable.strip(), 1) for variable in variables.split(","))
+
+def hacer_sitio(alertas, alerta):
+    # Con la cola llena se descarta la menos prioritaria y, entre iguales, la más antigua;
+    # devuelve False si la descartada es la nueva
+    menor = min(alertas, key=lambda a: a["prioridad"])
+    if menor["prioridad"] >= alerta["prioridad"]:
+        return False
+    alertas.remove(menor)
+    return True
+
+# Interfaz común de los sumideros: subclases implementan enviar()
+class SumideroNotificaciones:
+    nombre = "sumidero"
+    capacidad_cola = 100      # alertas pendientes como máximo
+    tamaño_lote = 20          # alertas por envío como máximo
+    espera_lote = 0.5         # segundos para agrupar alertas que llegan juntas
+    tiempo_limite = 10.0      # segundos por intento de envío
+    reintentos = 5
+    espera_reintento = 1.0    # primera espera entre reintentos (se duplica en cada intento)
+    espera_maxima = 60.0
+
+    async def enviar(self, alertas):
+        raise NotImplementedError
+
+    def formatear(self, alertas):
+        return "\n".join(
+            f"[{alerta['hora']}] Quirófano {alerta['id']}: Variables fuera de rango: {alerta['variables']}"
+            for alerta in alertas
+        )
+
+# Sumidero local para pruebas sin red: guarda los últimos lotes y puede simular lentitud y fallos
+class SumideroLocal(SumideroNotificaciones):
+    def __init__(self, nombre="local", retardo=0.0, fallos=0, registrar=False, max_lotes=100):
+        self.nombre = nombre
+        self.retardo = retardo
+        self.fallos = fallos
+        self.registrar = registrar
+        self.lotes = deque(maxlen=max_lotes)
+
+    async def enviar(self, alertas):
+        if self.retardo:
+            await asyncio.sleep(self.retardo)
+        if self.fallos > 0:
+            self.fallos -= 1
+            raise ConnectionError(f"Fallo simulado en {self.nombre}")
+        self.lotes.append(list(alertas))
+        if self.registrar:
+            logger.info("Notificación %s:\n%s", self.nombre, self.formatear(alertas))
+
+# Envío por correo a través de un relé SMTP
+class SumideroCorreo(SumideroNotificaciones):
+    nombre = "correo"
+
+    def __init__(self, servidor, remitente, destinatarios, puerto=25):
+        self.servidor = servidor
+        self.puerto = puerto
+        self.remitente = remitente
+        self.destinatarios = destinatarios
+
+    async def enviar(self, alertas):
+        mensaje = EmailMessage()
+        mensaje["Subject"] = f"Alertas de quirófanos ({len(alertas)})"
+        mensaje["From"] = self.remitente
+        mensaje["To"] = ", ".join(self.destinatarios)
+        mensaje.set_content(self.formatear(alertas))
+        # smtplib es bloqueante: ejecutarlo fuera del bucle
+        await asyncio.to_thread(self._enviar_smtp, mensaje)
+
+    def _enviar_smtp(self, mensaje):
+        with smtplib.SMTP(self.servidor, self.puerto, timeout=self.tiempo_limite) as smtp:
+            smtp.send_message(mensaje)
+
+# Envío a una pasarela HTTP (mensajería del hospital, buscapersonas) como JSON
+class SumideroHTTP(SumideroNotificaciones):
+    nombre = "http"
+
+    def __init__(self, url):
+        self.url = url
+
+    async def enviar(self, alertas):
+        await asyncio.to_thread(self._enviar_http, alertas)
+
+    def _enviar_http(self, alertas):
+        cuerpo = json.dumps({"alertas": alertas}).encode("utf-8")
+        peticion = urllib.request.Request(self.url, data=cuerpo, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(peticion, timeout=self.tiempo_limite) as respuesta:
+            respuesta.read()
+
+def sumideros_configurados():
+    # Sumideros definidos por variables de entorno; sin configuración se usa el sumidero local
+    sumideros = []
+    servidor_smtp = os.environ.get("QUIROFANOS_SMTP")
+    destinatarios = os.environ.get("QUIROFANOS_CORREO_DESTINO")
+    if servidor_smtp and destinatarios:
+        host, _, puerto = servidor_smtp.partition(":")
+        sumideros.append(SumideroCorreo(
+            host,
+            os.environ.get("QUIROFANOS_CORREO_REMITENTE", "quirofanos@localhost"),
+            [d.strip() for d in destinatarios.split(",")],
+            int(puerto or 25)
+        ))
+    url = os.environ.get("QUIROFANOS_WEBHOOK")
+    if url:
+        sumideros.append(SumideroHTTP(url))
+    if not sumideros:
+        sumideros.append(SumideroLocal(registrar=True))
+    return sumideros
+
+# Cola acotada de un sumidero; al llenarse descarta la alerta de menor prioridad
+class ColaAlertas:
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.alertas = deque()
+        self.descartadas = 0
+        # Se avisa una vez al saturarse, no por cada alerta descartada
+        self.saturada = False
+        self.disponible = asyncio.Event()
+
+    def __len__(self):
+        return len(self.alertas)
+
+    def poner(self, alerta):
+        if len(self.alertas) >= self.capacidad:
+            self.descartadas += 1
+            if not hacer_sitio(self.alertas, alerta):
+                return False
+        self.alertas.append(alerta)
+        self.disponible.set()
+        return True
+
+    async def tomar_lote(self, tamaño, espera):
+        while not self.alertas:
+            self.disponible.clear()
+            await self.disponible.wait()
+
+        # Dar un momento a que lleguen las alertas que vienen juntas
+        if len(self.alertas) < tamaño and espera:
+            await asyncio.sleep(espera)
+
+        lote = []
+        while self.alertas and len(lote) < tamaño:
+            lote.append(self.alertas.popleft())
+        return lote
+
+class DespachadorNotificaciones:
+    def __init__(self, sumideros, renotificar=None):
+        self.sumideros = list(sumideros)
+        self.bucle = None
+        self.hilo = None
+        self.colas = {}
+        self.tareas = []
+        self.listo = threading.Event()
+
+        # Entrada acotada entre los hilos que publican y el bucle: se drena en una sola llamada.
+        # Al llenarse se descarta con la misma regla de prioridad que las colas de los sumideros
+        self.entrada = deque()
+        self.bloqueo_entrada = threading.Lock()
+        self.descartadas_entrada = 0
+        self.drenado_programado = False
+
+        # Alarma notificada de cada quirófano: (variables, instante). Solo se publica al entrar en
+        # alarma, al cambiar las variables o, con renotificar (segundos), si la alarma sigue activa
+        self.renotificar = renotificar
+        self.alarmas = {}
+
+        # Contadores por sumidero
+        self.enviadas = {sumidero.nombre: 0 for sumidero in self.sumideros}
+        self.fallidas = {sumidero.nombre: 0 for sumidero in self.sumideros}
+
+    def iniciar(self):
+        self.hilo = threading.Thread(target=self._ejecutar, name="DespachadorNotificaciones", daemon=True)
+        self.hilo.start()
+        self.listo.wait()
+
+    def detener(self, espera=2.0):
+        if self.bucle is None:
+            return
+        self.bucle.call_soon_threadsafe(self._cancelar)
+        self.hilo.join(espera)
+
+    def publicar(self, quirofano_id, variables, hora=None):
+        # Seguro desde cualquier hilo y sin bloquear: la alerta se encola en el bucle
+        if self.bucle is None:
+            return
+        alerta = {
+            "id": quirofano_id,
+            "hora": hora or datetime.now().strftime("%H:%M:%S"),
+            "variables": variables,
+            "prioridad": prioridad_alerta(variables)
+        }
+        with self.bloqueo_entrada:
+            if len(self.entrada) >= CAPACIDAD_ENTRADA:
+                self.descartadas_entrada += 1
+                if not hacer_sitio(self.entrada, alerta):
+                    return
+            self.entrada.append(alerta)
+            if self.drenado_programado:
+                return
+            self.drenado_programado = True
+        self.bucle.call_soon_threadsafe(self._drenar)
+
+    def actualizar_alarma(self, quirofano_id, variables, hora=None):
+        # Se llama con cada lectura, siempre desde el mismo hilo; variables vacío si no hay alarma
+        if not variables:
+            self.alarmas.pop(quirofano_id, None)
+            return False
+        ahora = time.monotonic()
+        anterior = self.alarmas.get(quirofano_id)
+        if (anterior is not None and anterior[0] == variables
+                and (self.renotificar is None or ahora - anterior[1] < self.renotificar)):
+            return False
+        self.alarmas[quirofano_id] = (variables, ahora)
+        self.publicar(quirofano_id, variables, hora)
+        return True
+
+    def estadisticas(self):
+        return {
+            sumidero.nombre: {
+                "pendientes": len(self.colas[sumidero]) if sumidero in self.colas else 0,
+                "enviadas": self.enviadas[sumidero.nombre],
+                "fallidas": self.fallidas[sumidero.nombre],
+                # Las descartadas a la entrada no llegan a ningún sumidero
+                "descartadas": self.descartadas_entrada
+                               + (self.colas[sumidero].descartadas if sumidero in self.colas else 0)
+            }
+            for sumidero in self.sumideros
+        }
+
+    def _ejecutar(self):
+        self.bucle = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.bucle)
+        for sumidero in self.sumideros:
+            self.colas[sumidero] = ColaAlertas(sumidero.capacidad_cola)
+            self.tareas.append(self.bucle.create_task(self._trabajar(sumidero, self.colas[sumidero])))
+        self.bucle.call_soon(self.listo.set)
+        try:
+            self.bucle.run_forever()
+        finally:
+            self.bucle.close()
+
+    def _cancelar(self):
+        for tarea in self.tareas:
+            tarea.cancel()
+        # Parar el bucle cuando las tareas hayan procesado la cancelación
+        asyncio.ensure_future(self._parar(), loop=self.bucle)
+
+    async def _parar(self):
+        await asyncio.gather(*self.tareas, return_exceptions=True)
+        self.bucle.stop()
+
+    def _drenar(self):
+        # Tomar toda la entrada de una vez; una publicación posterior programa otro drenado
+        with self.bloqueo_entrada:
+            entrada = self.entrada
+            self.entrada = deque()
+            self.drenado_programado = False
+        for alerta in entrada:
+            self._encolar(alerta)
+
+    def _encolar(self, alerta):
+        for sumidero, cola in self.colas.items():
+            if not cola.poner(alerta) and not cola.saturada:
+                cola.saturada = True
+                logger.warning("Cola de %s llena: se descartan las alertas de menor prioridad", sumidero.nombre)
+
+    async def _trabajar(self, sumidero, cola):
+        while True:
+            lote = await cola.tomar_lote(sumidero.tamaño_lote, sumidero.espera_lote)
+            espera = sumidero.espera_reintento
+            for intento in range(sumidero.reintentos + 1):
+                try:
+                    await asyncio.wait_for(sumidero.enviar(lote), sumidero.tiempo_limite)
+                    self.enviadas[sumidero.nombre] += len(lote)
+                    if cola.saturada and not cola.alertas:
+                        cola.saturada = False
+                        logger.info("Cola de %s recuperada (%d alertas descartadas en total)",
+                                    sumidero.nombre, cola.descartadas)
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    if intento == sumidero.reintentos:
+                        self.fallidas[sumidero.nombre] += len(lote)
+                        logger.error("No se pudo notificar a %s tras %d intentos: %s",
+                                     sumidero.nombre, intento + 1, error)
+                        break
+                    logger.warning("Fallo al notificar a %s (%s), reintento en %.1f s",
+                                   sumidero.nombre, error, espera)
+                    # Espera exponencial con algo de aleatoriedad para no sincronizar reintentos
+                    await asyncio.sleep(espera * random.uniform(0.8, 1.2))
+                    espera = min(espera * 2, sumidero.espera_maxima)
@@ -0,0 +1,421 @@
+# Persistencia del estado de los quirófanos para reinicios rápidos y seguros ante fallos.
+#
+# Dos archivos en el directorio de estado:
+#   estado.wal   registro de escritura anticipada: cada lectura, cambio de estado y alerta se
+#                añade al final y se sincroniza con el disco cada INTERVALO_WAL, de modo que
+#                un fallo pierde como mucho esos segundos.
+#   estado.ckpt  checkpoint binario de tamaño fijo: cada quirófano tiene dos ranuras con CRC y
+#                número de secuencia, y el checkpoint periódico solo reescribe, en la ranura
+#                inactiva, los quirófanos que cambiaron. Si el proceso cae a mitad de una
+#                escritura sigue siendo válida la otra ranura.
+#
+# Al arrancar se lee el checkpoint con mmap y se aplica el WAL encima (las lecturas ya
+# incluidas en el checkpoint se ignoran por su timestamp).
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+import threading
+from collections import deque
+
+from PyQt5.QtCore import QObject, pyqtSlot
+
+logger = logging.getLogger(__name__)
+
+# Directorio por defecto del estado
+DIRECTORIO_ESTADO = os.path.join(os.path.expanduser("~"), ".control_quirofanos")
+
+# Segundos entre sincronizaciones del WAL y entre checkpoints
+INTERVALO_WAL = 2.0
+INTERVALO_CHECKPOINT = 30.0
+
+# Registros pendientes de escribir como máximo (unos 40 s de lecturas de 600 quirófanos en
+# uso). Si el disco no da abasto se descartan las lecturas más antiguas: el checkpoint sigue
+# guardando el historial de los sensores, y los cambios de estado y las alertas se conservan
+LIMITE_PENDIENTES = 50000
+
+ARCHIVO_CHECKPOINT = "estado.ckpt"
+ARCHIVO_WAL = "estado.wal"
+
+# Cabecera: firma, versión, registros por historial y número de quirófanos
+CABECERA = struct.Struct("<4sIII")
+FIRMA = b"QCKP"
+VERSION = 1
+
+# Ranura de alertas: crc, secuencia, longitud y JSON de tamaño acotado
+CABECERA_ALERTAS = struct.Struct("<IQI")
+TAMAÑO_RANURA_ALERTAS = 8192
+
+# Ranura de quirófano: crc, id, secuencia, en uso, muestras; después 4 series de float64
+CABECERA_QUIROFANO = struct.Struct("<IiQii")
+
+# Registros del WAL: crc, tipo y longitud, seguidos del contenido
+CABECERA_WAL = struct.Struct("<IBH")
+WAL_LECTURA = 1
+WAL_ESTADO = 2
+WAL_ALERTA = 3
+LECTURA = struct.Struct("<idddd")
+ESTADO = struct.Struct("<i?")
+
+SERIES = ("timestamps", "temperatura", "humedad", "presion")
+
+def codificar_registro(tipo, contenido):
+    crc = zlib.crc32(contenido, zlib.crc32(bytes((tipo,))))
+    return CABECERA_WAL.pack(crc, tipo, len(contenido)) + contenido
+
+def estado_vacio():
+    return {"en_uso": False, "timestamps": [], "temperatura": [], "humedad": [], "presion": []}
+
+class PersistenciaQuirofanos(QObject):
+    def __init__(self, directorio, max_historial, max_alertas, intervalo_historial=0.0, parent=None):
+        super().__init__(parent)
+        self.directorio = directorio
+        self.max_historial = max_historial
+        self.intervalo_historial = intervalo_historial  # diezmado del historial, como en los sensores
+        self.ruta_checkpoint = os.path.join(directorio, ARCHIVO_CHECKPOINT)
+        self.ruta_wal = os.path.join(directorio, ARCHIVO_WAL)
+        self.registro_quirofano = struct.Struct(f"<{len(SERIES) * max_historial}d")
+        self.tamaño_ranura = CABECERA_QUIROFANO.size + self.registro_quirofano.size
+
+        # Sensores registrados, en el orden de sus ranuras en el checkpoint
+        self.sensores = {}
+        self.indices = {}
+
+        # Ranura activa de cada quirófano y secuencia global de escritura
+        self.ranura_activa = {}
+        self.ranura_alertas = 0
+        self.secuencia = 0
+
+        # Quirófanos y alertas modificados desde el último checkpoint (el hilo de escritura
+        # solo usa self.ranura_activa, self.ranura_alertas y self.secuencia)
+        self.cambiados = set()
+        self.alertas_cambiadas = False
+        self.alertas = deque(maxlen=max_alertas)
+
+        # Registros codificados pendientes de escribir en el WAL; la condición protege
+        # también los quirófanos y alertas cambiados
+        self.pendientes = []
+        self.descartados = 0
+        # Se avisa una vez al saturarse, no por cada lectura descartada
+        self.saturado = False
+        self.condicion = threading.Condition()
+        self.activo = False
+        self.hilo = None
+        self.wal = None
+        self.checkpoint = None
+
+    # --- Carga ---------------------------------------------------------------
+
+    def cargar(self):
+        # Devuelve (estados por quirófano, alertas) a partir del checkpoint y del WAL
+        estados, alertas = self._leer_checkpoint()
+        self._aplicar_wal(estados, alertas)
+        for alerta in alertas:
+            self.alertas.append(alerta)
+        return estados, list(self.alertas)
+
+    def _leer_checkpoint(self):
+        estados = {}
+        alertas = []
+        if not os.path.exists(self.ruta_checkpoint) or os.path.getsize(self.ruta_checkpoint) < CABECERA.size:
+            return estados, alertas
+
+        with open(self.ruta_checkpoint, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            firma, version, max_historial, num = CABECERA.unpack_from(mm, 0)
+            if firma != FIRMA or version != VERSION:
+                return estados, alertas
+            registro = struct.Struct(f"<{len(SERIES) * max_historial}d")
+            tamaño_ranura = CABECERA_QUIROFANO.size + registro.size
+
+            # Alertas: la ranura válida con mayor secuencia
+            mejor = None
+            for ranura in range(2):
+                desplazamiento = CABECERA.size + ranura * TAMAÑO_RANURA_ALERTAS
+                crc, secuencia, longitud = CABECERA_ALERTAS.unpack_from(mm, desplazamiento)
+                inicio = desplazamiento + CABECERA_ALERTAS.size
+                if longitud > TAMAÑO_RANURA_ALERTAS - CABECERA_ALERTAS.size:
+                    continue
+                contenido = mm[inicio:inicio + longitud]
+                if zlib.crc32(contenido, zlib.crc32(struct.pack("<QI", secuencia, longitud))) != crc:
+                    continue
+                if mejor is None or secuencia > mejor[0]:
+                    mejor = (secuencia, contenido)
+            if mejor is not None:
+                alertas = json.loads(mejor[1])
+
+            # Quirófanos: para cada uno, la ranura válida con mayor secuencia
+            base = CABECERA.size + 2 * TAMAÑO_RANURA_ALERTAS
+            for indice in range(num):
+                mejor = None
+                for ranura in range(2):
+                    desplazamiento = base + (2 * indice + ranura) * tamaño_ranura
+                    if desplazamiento + tamaño_ranura > len(mm):
+                        break
+                    crc, quirofano_id, secuencia, en_uso, n = CABECERA_QUIROFANO.unpack_from(mm, desplazamiento)
+                    if zlib.crc32(mm[desplazamiento + 4:desplazamiento + tamaño_ranura]) != crc:
+                        continue
+                    if mejor is None or secuencia > mejor[0]:
+                        mejor = (secuencia, desplazamiento, quirofano_id, en_uso, n)
+                if mejor is None:
+                    continue
+                _, desplazamiento, quirofano_id, en_uso, n = mejor
+                valores = registro.unpack_from(mm, desplazamiento + CABECERA_QUIROFANO.size)
+                estado = {"en_uso": bool(en_uso)}
+                for i, serie in enumerate(SERIES):
+                    estado[serie] = list(valores[i * max_historial:i * max_historial + n])
+                estados[quirofano_id] = estado
+        return estados, alertas
+
+    def _aplicar_wal(self, estados, alertas):
+        if not os.path.exists(self.ruta_wal):
+            return
+        with open(self.ruta_wal, "rb") as f:
+            datos = f.read()
+
+        ultima_alerta = alertas[-1]["timestamp"] if alertas else 0.0
+        posicion = 0
+        while posicion + CABECERA_WAL.size <= len(datos):
+            crc, tipo, longitud = CABECERA_WAL.unpack_from(datos, posicion)
+            inicio = posicion + CABECERA_WAL.size
+            contenido = datos[inicio:inicio + longitud]
+            # Un registro incompleto o corrupto marca el final de lo que llegó al disco
+            if len(contenido) < longitud or zlib.crc32(contenido, zlib.crc32(bytes((tipo,)))) != crc:
+                break
+            posicion = inicio + longitud
+
+            if tipo == WAL_LECTURA:
+                quirofano_id, timestamp, temperatura, humedad, presion = LECTURA.unpack(contenido)
+                estado = estados.setdefault(quirofano_id, estado_vacio())
+                timestamps = estado["timestamps"]
+                if timestamps and timestamp <= timestamps[-1]:
+                    continue
+                # Reproducir el diezmado: la lectura sustituye a la última si esta es muy reciente
+                sustituir = len(timestamps) > 1 and timestamps[-1] - timestamps[-2] < self.intervalo_historial
+                for serie, valor in zip(SERIES, (timestamp, temperatura, humedad, presion)):
+                    if sustituir:
+                        estado[serie][-1] = valor
+                    else:
+                        estado[serie].append(valor)
+                        del estado[serie][:-self.max_historial]
+            elif tipo == WAL_ESTADO:
+                quirofano_id, en_uso = ESTADO.unpack(contenido)
+                estados.setdefault(quirofano_id, estado_vacio())["en_uso"] = en_uso
+            elif tipo == WAL_ALERTA:
+                alerta = json.loads(contenido)
+                if alerta["timestamp"] > ultima_alerta:
+                    alertas.append(alerta)
+
+    # --- Escritura -------------------------------------------------------------
+    # El hilo de la interfaz solo codifica los registros y los deja en self.pendientes; las
+    # escrituras y los fsync del WAL y del checkpoint los hace un hilo propio, de modo que un
+    # disco lento nunca retrasa a la interfaz ni a los visores.
+
+    def registrar_sensor(self, sensor):
+        self.indices[sensor.quirofano_id] = len(self.sensores)
+        self.sensores[sensor.quirofano_id] = sensor
+        self.ranura_activa[sensor.quirofano_id] = 0
+        sensor.actualizar_datos.connect(self.registrar_lectura)
+        sensor.estado_cambiado.connect(self.registrar_estado)
+
+    def iniciar(self):
+        self.activo = True
+        self.hilo = threading.Thread(target=self._ejecutar, name="PersistenciaQuirofanos", daemon=True)
+        self.hilo.start()
+
+    def cerrar(self):
+        # Guarda un último checkpoint y espera a que termine
+        if self.hilo is None:
+            return
+        with self.condicion:
+            self.activo = False
+            self.condicion.notify()
+        self.hilo.join()
+        self.hilo = None
+
+    @pyqtSlot(dict)
+    def registrar_lectura(self, datos):
+        quirofano_id = self.sender().quirofano_id
+        registro = codificar_registro(WAL_LECTURA, LECTURA.pack(quirofano_id, datos['timestamp'], datos['temperatura'],
+                                                                datos['humedad'], datos['presion']))
+        with self.condicion:
+            self._añadir_pendiente(registro)
+            self.cambiados.add(quirofano_id)
+
+    @pyqtSlot(bool)
+    def registrar_estado(self, en_uso):
+        quirofano_id = self.sender().quirofano_id
+        registro = codificar_registro(WAL_ESTADO, ESTADO.pack(quirofano_id, en_uso))
+        with self.condicion:
+            self._añadir_pendiente(registro)
+            self.cambiados.add(quirofano_id)
+
+    def registrar_alerta(self, quirofano_id, variables, hora, timestamp):
+        alerta = {"id": quirofano_id, "hora": hora, "variables": variables, "timestamp": timestamp}
+        registro = codificar_registro(WAL_ALERTA, json.dumps(alerta).encode("utf-8"))
+        with self.condicion:
+            self.alertas.append(alerta)
+            self._añadir_pendiente(registro)
+            self.alertas_cambiadas = True
+
+    def _añadir_pendiente(self, registro):
+        # Se llama con self.condicion adquirida
+        self.pendientes.append(registro)
+        if len(self.pendientes) <= LIMITE_PENDIENTES:
+            return
+        # Descartar de una vez las lecturas más antiguas hasta dejar una cuarta parte libre,
+        # para no recorrer la lista con cada registro nuevo
+        sobran = len(self.pendientes) - LIMITE_PENDIENTES * 3 // 4
+        conservados = []
+        for pendiente in self.pendientes:
+            # El tipo del registro va tras el CRC
+            if sobran and pendiente[4] == WAL_LECTURA:
+                sobran -= 1
+            else:
+                conservados.append(pendiente)
+        self.descartados += len(self.pendientes) - len(conservados)
+        self.pendientes = conservados
+        if not self.saturado:
+            self.saturado = True
+            logger.warning("El WAL no da abasto: se descartan las lecturas pendientes más antiguas")
+
+    def _ejecutar(self):
+        os.makedirs(self.directorio, exist_ok=True)
+
+        # Checkpoint completo con el estado restaurado; a partir de aquí, solo incremental.
+        # El WAL solo se vacía cuando el nuevo checkpoint ya es duradero: antes, un fallo
+        # dejaría el checkpoint anterior sin el WAL que lo completa
+        self._escribir_checkpoint_completo()
+        self.wal = open(self.ruta_wal, "wb")
+        # Hacer duradera la entrada del WAL si se acaba de crear
+        self._sincronizar_directorio()
+
+        proximo_checkpoint = time.monotonic() + INTERVALO_CHECKPOINT
+        activo = True
+        while activo:
+            with self.condicion:
+                if self.activo:
+                    self.condicion.wait(INTERVALO_WAL)
+                activo = self.activo
+            if not activo or time.monotonic() >= proximo_checkpoint:
+                self._guardar_checkpoint()
+                proximo_checkpoint = time.monotonic() + INTERVALO_CHECKPOINT
+            else:
+                self._sincronizar_wal()
+
+        self.wal.close()
+        self.checkpoint.close()
+
+    def _sincronizar_wal(self):
+        with self.condicion:
+            pendientes = self.pendientes
+            self.pendientes = []
+            recuperado = self.saturado
+            self.saturado = False
+        self._escribir_wal(pendientes, recuperado)
+
+    def _escribir_wal(self, pendientes, recuperado):
+        if pendientes:
+            self.wal.write(b"".join(pendientes))
+            self.wal.flush()
+            os.fsync(self.wal.fileno())
+        if recuperado:
+            logger.info("WAL recuperado (%d lecturas descartadas en total)", self.descartados)
+
+    def _guardar_checkpoint(self):
+        # Todo lo pendiente queda primero en el WAL: si el checkpoint falla, se reproduce.
+        # Lo que llegue después se queda en self.pendientes y va al WAL ya vaciado; si el
+        # checkpoint ya incluía esas lecturas, al cargar se ignoran por su timestamp
+        with self.condicion:
+            pendientes = self.pendientes
+            self.pendientes = []
+            cambiados = self.cambiados
+            self.cambiados = set()
+            alertas = list(self.alertas) if self.alertas_cambiadas else None
+            self.alertas_cambiadas = False
+            recuperado = self.saturado
+            self.saturado = False
+        self._escribir_wal(pendientes, recuperado)
+        if not cambiados and alertas is None:
+            return
+
+        for quirofano_id in cambiados:
+            self._escribir_quirofano(quirofano_id)
+        if alertas is not None:
+            self._escribir_alertas(alertas)
+        self.checkpoint.flush()
+        os.fsync(self.checkpoint.fileno())
+
+        # El checkpoint ya contiene todo lo registrado en el WAL
+        self.wal.seek(0)
+        self.wal.truncate()
+        os.fsync(self.wal.fileno())
+
+    def _escribir_checkpoint_completo(self):
+        with self.condicion:
+            self.cambiados = set()
+            self.alertas_cambiadas = False
+            alertas = list(self.alertas)
+        temporal = self.ruta_checkpoint + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(CABECERA.pack(FIRMA, VERSION, self.max_historial, len(self.sensores)))
+            f.truncate(CABECERA.size + 2 * TAMAÑO_RANURA_ALERTAS + 2 * len(self.sensores) * self.tamaño_ranura)
+            self.checkpoint = f
+            self._escribir_alertas(alertas)
+            for quirofano_id in self.sensores:
+                self._escribir_quirofano(quirofano_id)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta_checkpoint)
+        self._sincronizar_directorio()
+        self.checkpoint = open(self.ruta_checkpoint, "r+b")
+
+    def _escribir_alertas(self, alertas):
+        self.secuencia += 1
+        contenido = json.dumps(alertas).encode("utf-8")
+        while len(contenido) > TAMAÑO_RANURA_ALERTAS - CABECERA_ALERTAS.size:
+            # Recortar las más antiguas si no caben en la ranura
+            alertas = alertas[1:]
+            contenido = json.dumps(alertas).encode("utf-8")
+        crc = zlib.crc32(contenido, zlib.crc32(struct.pack("<QI", self.secuencia, len(contenido))))
+
+        # Escribir en la ranura inactiva
+        self.ranura_alertas = 1 - self.ranura_alertas
+        self.checkpoint.seek(CABECERA.size + self.ranura_alertas * TAMAÑO_RANURA_ALERTAS)
+        self.checkpoint.write(CABECERA_ALERTAS.pack(crc, self.secuencia, len(contenido)) + contenido)
+
+    def _escribir_quirofano(self, quirofano_id):
+        sensor = self.sensores[quirofano_id]
+
+        # Los historiales los modifica el hilo de muestreo: guardar una copia coherente
+        historial = sensor.copiar_historial()
+        series = [historial[serie] for serie in SERIES]
+        n = min(len(series[0]), self.max_historial)
+        valores = []
+        for serie in series:
+            valores.extend(serie[len(serie) - n:])
+            valores.extend([0.0] * (self.max_historial - n))
+
+        self.secuencia += 1
+        cuerpo = (CABECERA_QUIROFANO.pack(0, quirofano_id, self.secuencia, int(sensor.en_uso), n)[4:]
+                  + self.registro_quirofano.pack(*valores))
+        crc = zlib.crc32(cuerpo)
+
+        # Escribir en la ranura inactiva
+        ranura = 1 - self.ranura_activa[quirofano_id]
+        self.ranura_activa[quirofano_id] = ranura
+        desplazamiento = (CABECERA.size + 2 * TAMAÑO_RANURA_ALERTAS
+                          + (2 * self.indices[quirofano_id] + ranura) * self.tamaño_ranura)
+        self.checkpoint.seek(desplazamiento)
+        self.checkpoint.write(struct.pack("<I", crc) + cuerpo)
+
+    def _sincronizar_directorio(self):
+        # Hacer duraderos el os.replace del checkpoint y la creación del WAL (no disponible en Windows)
+        if hasattr(os, "O_DIRECTORY"):
+            descriptor = os.open(self.directorio, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
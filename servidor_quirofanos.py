@@ -0,0 +1,342 @@
+# Servidor de adquisición: un único proceso es dueño de los sensores, las alertas y el
+# historial, y cualquier número de visores ligeros se conecta por un socket local
+# (socket Unix / tubería con nombre) o por TCP en la interfaz de loopback.
+#
+# Protocolo: un mensaje JSON por línea.
+#   visor -> servidor:  {"tipo": "suscribir", "quirofanos": [1, 2]}      (null = todos)
+#                       {"tipo": "cambiar_estado", "id": 1, "en_uso": true}
+#   servidor -> visor:  {"tipo": "snapshot", "quirofanos": [...], "alertas": [...]}
+#                       {"tipo": "lectura", "id": 1, "timestamp": ..., "temperatura": ..., ...}
+#                       {"tipo": "estado", "id": 1, "en_uso": true}
+#
+# Uso:
+#   python servidor_quirofanos.py --quirofanos 6
+#   python servidor_quirofanos.py --puerto 5800
+import os
+import sys
+import json
+import signal
+import logging
+import argparse
+from collections import deque
+from datetime import datetime
+
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtSlot
+from PyQt5.QtNetwork import QLocalServer, QTcpServer, QHostAddress
+
+from control_quirofanos import (SensorSimulado, PlanificadorMuestreo, NUM_QUIROFANOS, MAX_ALERTAS,
+                                MAX_HISTORIAL, INTERVALO_BASE, evaluar_alertas, variables_en_alerta)
+from notificaciones_quirofanos import DespachadorNotificaciones, sumideros_configurados
+from memoria_quirofanos import MonitorMemoria, INTERVALO_INFORME
+from persistencia_quirofanos import PersistenciaQuirofanos, DIRECTORIO_ESTADO
+
+logger = logging.getLogger(__name__)
+
+# Nombre del socket local por defecto
+NOMBRE_SOCKET = "control_quirofanos"
+
+# Bytes pendientes de envío a partir de los cuales un visor se considera lento
+LIMITE_BUFFER_VISOR = 256 * 1024
+
+# Tamaño máximo de un mensaje recibido (un snapshot de muchos quirófanos cabe de sobra)
+LIMITE_MENSAJE = 16 * 1024 * 1024
+
+def codificar_mensaje(mensaje):
+    return json.dumps(mensaje, separators=(",", ":")).encode("utf-8") + b"\n"
+
+def es_id_quirofano(valor):
+    # bool es subclase de int, pero true/false no son identificadores válidos
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+def mensaje_valido(mensaje):
+    # Comprobar la forma de un mensaje del visor antes de atenderlo
+    if not isinstance(mensaje, dict):
+        return False
+    tipo = mensaje.get("tipo")
+    if tipo == "suscribir":
+        quirofanos = mensaje.get("quirofanos")
+        return quirofanos is None or (isinstance(quirofanos, list) and all(es_id_quirofano(q) for q in quirofanos))
+    if tipo == "cambiar_estado":
+        return es_id_quirofano(mensaje.get("id"))
+    return False
+
+# Acumula los bytes recibidos y devuelve los mensajes completos
+class LectorMensajes:
+    def __init__(self):
+        self.buffer = b""
+
+    def leer(self, datos):
+        self.buffer += datos
+        *lineas, self.buffer = self.buffer.split(b"\n")
+        if len(self.buffer) > LIMITE_MENSAJE:
+            # Descartar un mensaje sin fin de línea que no cabe en el límite
+            self.buffer = b""
+        mensajes = []
+        for linea in lineas:
+            if not linea:
+                continue
+            try:
+                mensajes.append(json.loads(linea))
+            except ValueError:
+                # Ignorar líneas corruptas sin cortar la conexión
+                continue
+        return mensajes
+
+# Estado del servidor para cada visor conectado
+class ConexionVisor:
+    def __init__(self, socket):
+        self.socket = socket
+        self.lector = LectorMensajes()
+        self.quirofanos = set()
+        # Un visor lento deja de recibir lecturas y se resincroniza con un snapshot
+        self.desincronizado = False
+        # Bytes del buffer de envío que hay que vaciar hasta terminar el último snapshot; no
+        # cuentan para el límite, porque un snapshot grande lo supera por sí solo
+        self.pendiente_snapshot = 0
+
+class ServidorQuirofanos(QObject):
+    def __init__(self, num_quirofanos=NUM_QUIROFANOS, despachador=None, persistencia=None, parent=None):
+        super().__init__(parent)
+        self.servidor = None
+        self.conexiones = []
+        self.despachador = despachador # Envía las alertas a sistemas externos
+        self.persistencia = persistencia # Checkpoint y WAL para reiniciar sin perder el estado
+
+        # Visores suscritos a cada quirófano
+        self.suscriptores = {}
+
+        # Alertas recientes, para los visores que se conectan más tarde
+        self.historial_alertas = deque(maxlen=MAX_ALERTAS)
+        # Variables de la alarma en curso de cada quirófano (vacío si no hay alarma): el
+        # historial solo recibe una alerta al entrar en alarma o al cambiar sus variables
+        self.variables_alarma = {}
+
+        # Sensores propios del servidor, muestreados por un único hilo
+        self.planificador = PlanificadorMuestreo(self)
+        self.sensores = {}
+        for i in range(num_quirofanos):
+            sensor = SensorSimulado(i + 1)
+            sensor.actualizar_datos.connect(self.difundir_lectura)
+            sensor.estado_cambiado.connect(self.difundir_estado)
+            self.planificador.agregar(sensor)
+            self.sensores[sensor.quirofano_id] = sensor
+            self.suscriptores[sensor.quirofano_id] = set()
+
+        # Recuperar el estado anterior antes de generar lecturas nuevas
+        if self.persistencia is not None:
+            estados, alertas = self.persistencia.cargar()
+            for sensor in self.sensores.values():
+                if sensor.quirofano_id in estados:
+                    sensor.restaurar(estados[sensor.quirofano_id])
+                    if sensor.timestamps:
+                        # La alarma en curso ya está en las alertas restauradas
+                        datos = sensor.ultima_lectura()
+                        alertas_sensor = evaluar_alertas(datos['temperatura'], datos['humedad'], datos['presion'])
+                        if sensor.en_uso and any(alertas_sensor.values()):
+                            self.variables_alarma[sensor.quirofano_id] = variables_en_alerta(alertas_sensor)
+                self.persistencia.registrar_sensor(sensor)
+            self.historial_alertas.extend(alertas)
+
+    def iniciar(self):
+        if self.persistencia is not None:
+            self.persistencia.iniciar()
+        self.planificador.start()
+
+    def detener(self):
+        self.planificador.detener()
+        if self.persistencia is not None:
+            self.persistencia.cerrar()
+        if self.servidor is not None:
+            self.servidor.close()
+
+    def escuchar(self, nombre=NOMBRE_SOCKET, puerto=None):
+        if puerto is None:
+            # Eliminar un socket que haya quedado de una ejecución anterior
+            QLocalServer.removeServer(nombre)
+            self.servidor = QLocalServer(self)
+            ok = self.servidor.listen(nombre)
+            direccion = nombre
+        else:
+            self.servidor = QTcpServer(self)
+            ok = self.servidor.listen(QHostAddress.LocalHost, puerto)
+            direccion = f"127.0.0.1:{puerto}"
+        if not ok:
+            raise RuntimeError(f"No se pudo escuchar en {direccion}: {self.servidor.errorString()}")
+        self.servidor.newConnection.connect(self.nueva_conexion)
+        return direccion
+
+    def nueva_conexion(self):
+        while self.servidor.hasPendingConnections():
+            socket = self.servidor.nextPendingConnection()
+            conexion = ConexionVisor(socket)
+            self.conexiones.append(conexion)
+            socket.readyRead.connect(lambda conexion=conexion: self.leer(conexion))
+            socket.bytesWritten.connect(lambda escritos, conexion=conexion: self.vaciado(conexion, escritos))
+            socket.disconnected.connect(lambda conexion=conexion: self.desconectar(conexion))
+
+    def desconectar(self, conexion):
+        for quirofano_id in conexion.quirofanos:
+            self.suscriptores[quirofano_id].discard(conexion)
+        conexion.quirofanos = set()
+        if conexion in self.conexiones:
+            self.conexiones.remove(conexion)
+        conexion.socket.deleteLater()
+
+    def leer(self, conexion):
+        # Una excepción que saliera de este slot terminaría el proceso: un visor defectuoso
+        # solo puede perder su propia conexión
+        try:
+            for mensaje in conexion.lector.leer(bytes(conexion.socket.readAll())):
+                if not mensaje_valido(mensaje):
+                    # Ignorar mensajes mal formados o desconocidos sin cortar la conexión
+                    continue
+                if mensaje["tipo"] == "suscribir":
+                    self.suscribir(conexion, mensaje.get("quirofanos"))
+                else:
+                    sensor = self.sensores.get(mensaje["id"])
+                    if sensor is not None:
+                        sensor.cambiar_estado(bool(mensaje.get("en_uso")))
+        except Exception:
+            logger.exception("Error al atender a un visor: se cierra su conexión")
+            conexion.socket.abort()
+            if conexion in self.conexiones:
+                self.desconectar(conexion)
+
+    def suscribir(self, conexion, quirofanos):
+        if quirofanos is None:
+            quirofanos = self.sensores.keys()
+
+        # Reemplazar la suscripción anterior del visor
+        for quirofano_id in conexion.quirofanos:
+            self.suscriptores[quirofano_id].discard(conexion)
+        conexion.quirofanos = {q for q in quirofanos if q in self.sensores}
+        for quirofano_id in conexion.quirofanos:
+            self.suscriptores[quirofano_id].add(conexion)
+
+        self.enviar_snapshot(conexion)
+
+    def snapshot_quirofano(self, sensor):
+        # Los historiales los modifica el hilo de muestreo: enviar una copia coherente
+        historial = sensor.copiar_historial()
+        return {
+            "id": sensor.quirofano_id,
+            "en_uso": sensor.en_uso,
+            "timestamps": historial['timestamps'],
+            "temperatura": historial['temperatura'],
+            "humedad": historial['humedad'],
+            "presion": historial['presion']
+        }
+
+    def enviar_snapshot(self, conexion):
+        mensaje = {
+            "tipo": "snapshot",
+            "quirofanos": [self.snapshot_quirofano(self.sensores[q]) for q in sorted(conexion.quirofanos)],
+            "alertas": [alerta for alerta in self.historial_alertas if alerta["id"] in conexion.quirofanos]
+        }
+        conexion.socket.write(codificar_mensaje(mensaje))
+        conexion.pendiente_snapshot = conexion.socket.bytesToWrite()
+
+    def enviar(self, conexion, datos):
+        if conexion.desincronizado:
+            return
+        if conexion.socket.bytesToWrite() - conexion.pendiente_snapshot > LIMITE_BUFFER_VISOR:
+            # No acumular lecturas para un visor que no las consume
+            conexion.desincronizado = True
+            return
+        conexion.socket.write(datos)
+
+    def vaciado(self, conexion, escritos):
+        conexion.pendiente_snapshot = max(0, conexion.pendiente_snapshot - escritos)
+        if conexion.desincronizado and conexion.socket.bytesToWrite() == 0:
+            conexion.desincronizado = False
+            self.enviar_snapshot(conexion)
+
+    def difundir(self, quirofano_id, mensaje):
+        suscriptores = self.suscriptores[quirofano_id]
+        if not suscriptores:
+            return
+        # Codificar una sola vez para todos los visores
+        datos = codificar_mensaje(mensaje)
+        for conexion in suscriptores:
+            self.enviar(conexion, datos)
+
+    @pyqtSlot(dict)
+    def difundir_lectura(self, datos):
+        quirofano_id = self.sender().quirofano_id
+
+        # Registrar la alerta en el servidor, igual que la vista local: solo al entrar en
+        # alarma o cuando cambian las variables fuera de rango
+        alertas = evaluar_alertas(datos['temperatura'], datos['humedad'], datos['presion'])
+        en_alarma = datos['en_uso'] and any(alertas.values())
+        variables = variables_en_alerta(alertas) if en_alarma else ""
+        hora = datetime.now().strftime("%H:%M:%S") if variables else None
+        if variables and variables != self.variables_alarma.get(quirofano_id, ""):
+            self.historial_alertas.append({"id": quirofano_id, "hora": hora, "variables": variables})
+            if self.persistencia is not None:
+                self.persistencia.registrar_alerta(quirofano_id, variables, hora, datos['timestamp'])
+        self.variables_alarma[quirofano_id] = variables
+
+        # Notificar fuera del servidor solo los cambios de alarma (el despachador decide, y
+        # también si una alarma que sigue activa se vuelve a notificar)
+        if self.despachador is not None:
+            self.despachador.actualizar_alarma(quirofano_id, variables or None, hora)
+
+        self.difundir(quirofano_id, {
+            "tipo": "lectura",
+            "id": quirofano_id,
+            "timestamp": datos['timestamp'],
+            "temperatura": datos['temperatura'],
+            "humedad": datos['humedad'],
+            "presion": datos['presion'],
+            "en_uso": datos['en_uso']
+        })
+
+    @pyqtSlot(bool)
+    def difundir_estado(self, en_uso):
+        quirofano_id = self.sender().quirofano_id
+        self.difundir(quirofano_id, {"tipo": "estado", "id": quirofano_id, "en_uso": en_uso})
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de adquisición de quirófanos")
+    parser.add_argument("--quirofanos", type=int, default=NUM_QUIROFANOS, help="número de quirófanos")
+    parser.add_argument("--socket", default=NOMBRE_SOCKET, help="nombre del socket local")
+    parser.add_argument("--puerto", type=int, help="usar TCP en 127.0.0.1 en lugar del socket local")
+    parser.add_argument("--larga-duracion", action="store_true",
+                        help="informar periódicamente del uso de memoria")
+    parser.add_argument("--intervalo-memoria", type=int, default=INTERVALO_INFORME,
+                        help="segundos entre informes de memoria")
+    parser.add_argument("--renotificar", type=float,
+                        help="segundos tras los que se vuelve a notificar una alarma que sigue activa")
+    parser.add_argument("--estado", default=os.path.join(DIRECTORIO_ESTADO, "servidor"),
+                        help="directorio del checkpoint y del WAL para reiniciar sin perder el estado")
+    parser.add_argument("--sin-estado", action="store_true", help="no guardar ni restaurar el estado")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    app = QCoreApplication(sys.argv)
+    if args.larga_duracion:
+        monitor = MonitorMemoria(args.intervalo_memoria)
+        monitor.iniciar()
+        app.aboutToQuit.connect(monitor.detener)
+    despachador = DespachadorNotificaciones(sumideros_configurados(), args.renotificar)
+    despachador.iniciar()
+    app.aboutToQuit.connect(despachador.detener)
+    persistencia = None
+    if not args.sin_estado:
+        persistencia = PersistenciaQuirofanos(args.estado, MAX_HISTORIAL, MAX_ALERTAS, INTERVALO_BASE)
+    servidor = ServidorQuirofanos(args.quirofanos, despachador, persistencia)
+    direccion = servidor.escuchar(args.socket, args.puerto)
+    servidor.iniciar()
+    app.aboutToQuit.connect(servidor.detener)
+    print(f"Servidor de quirófanos escuchando en {direccion}")
+
+    # Permitir Ctrl+C: Python solo atiende señales cuando recupera el control
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    timer_señales = QTimer()
+    timer_señales.timeout.connect(lambda: None)
+    timer_señales.start(500)
+
+    return app.exec_()
+
+if __name__ == '__main__':
+    sys.exit(main())
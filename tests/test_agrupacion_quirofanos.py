@@ -0,0 +1,84 @@
+# Pruebas del modelo de agrupación: los agregados incrementales deben coincidir con un
+# recálculo completo a partir de las últimas lecturas de cada quirófano.
+#
+# Uso:
+#   python -m pytest tests
+import os
+import sys
+import random
+import unittest
+
+# Permitir importar los módulos desde la raíz del repositorio
+DIRECTORIO_TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_TESTS))
+
+from agrupacion_quirofanos import ModeloAgrupacion, VARIABLES, severidad
+
+RANGOS = {'temperatura': (18.0, 24.0), 'humedad': (30.0, 60.0), 'presion': (5.0, 15.0)}
+
+def lectura_aleatoria(aleatorio):
+    # Valores dentro y fuera del rango, con repeticiones para provocar empates
+    return {variable: round(aleatorio.uniform(minimo - 5, maximo + 5), 1)
+            for variable, (minimo, maximo) in RANGOS.items()}
+
+def recalcular(modelo, grupo):
+    # Agregados del grupo recorriendo todas las lecturas de sus quirófanos
+    quirofanos = [q for q, lectura in modelo.lecturas.items() if grupo in modelo.grupos_quirofano[q]]
+    resultado = {"en_alarma": 0, "presion_media": None, "peor": {}}
+    if not quirofanos:
+        return resultado
+    resultado["en_alarma"] = sum(
+        any(severidad(modelo.lecturas[q][variable], RANGOS[variable]) > 0 for variable in VARIABLES)
+        for q in quirofanos)
+    resultado["presion_media"] = sum(modelo.lecturas[q]['presion'] for q in quirofanos) / len(quirofanos)
+    for variable in VARIABLES:
+        # El más grave y, entre iguales, el de menor número, como el montículo
+        peor = max(quirofanos, key=lambda q: (severidad(modelo.lecturas[q][variable], RANGOS[variable]), -q))
+        resultado["peor"][variable] = (peor, severidad(modelo.lecturas[peor][variable], RANGOS[variable]))
+    return resultado
+
+class PruebaAgrupacion(unittest.TestCase):
+    def comprobar(self, modelo):
+        for grupo in modelo.grupos():
+            esperado = recalcular(modelo, grupo)
+            self.assertEqual(grupo.en_alarma, esperado["en_alarma"], grupo.nombre)
+            if esperado["presion_media"] is None:
+                self.assertIsNone(grupo.presion_media())
+            else:
+                self.assertAlmostEqual(grupo.presion_media(), esperado["presion_media"], places=6)
+            for variable in VARIABLES:
+                self.assertEqual(grupo.peor(variable), esperado["peor"].get(variable), (grupo.nombre, variable))
+
+    def test_coincide_con_recalculo_completo(self):
+        aleatorio = random.Random(0)
+        quirofanos = list(range(1, 40))
+        modelo = ModeloAgrupacion(quirofanos, RANGOS)
+        self.comprobar(modelo)
+
+        # Suficientes lecturas para que los montículos se reconstruyan varias veces
+        for i in range(3000):
+            modelo.actualizar(aleatorio.choice(quirofanos), **lectura_aleatoria(aleatorio))
+            if i % 97 == 0:
+                self.comprobar(modelo)
+        self.comprobar(modelo)
+
+    def test_monticulos_acotados(self):
+        aleatorio = random.Random(1)
+        modelo = ModeloAgrupacion([1, 2, 3], RANGOS)
+        for _ in range(1000):
+            modelo.actualizar(aleatorio.choice([1, 2, 3]), **lectura_aleatoria(aleatorio))
+        for grupo in modelo.grupos():
+            for variable in VARIABLES:
+                self.assertLessEqual(len(grupo.monticulos[variable]), 2 * 3 + 16 + 1)
+
+    def test_cambios_solo_de_los_antecesores(self):
+        modelo = ModeloAgrupacion(range(1, 13), RANGOS)
+        modelo.actualizar(4, 20.0, 45.0, 10.0)
+        quirofanos, grupos = modelo.tomar_cambios()
+        self.assertEqual(quirofanos, {4})
+        self.assertEqual(grupos, set(modelo.grupos_quirofano[4]))
+        self.assertEqual([grupo.nombre for grupo in modelo.grupos_quirofano[4]], ["Ala B", "Planta 1", "Hospital"])
+        self.assertEqual(modelo.tomar_cambios(), (set(), set()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# Pruebas del despacho de notificaciones: lotes, reintentos, tiempo límite, descarte por
+# prioridad y notificación solo de los cambios de alarma.
+#
+# Uso:
+#   python -m pytest tests
+import os
+import sys
+import time
+import asyncio
+import logging
+import unittest
+from collections import deque
+
+# Permitir importar los módulos desde la raíz del repositorio
+DIRECTORIO_TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_TESTS))
+
+from notificaciones_quirofanos import (DespachadorNotificaciones, SumideroLocal, ColaAlertas, CAPACIDAD_ENTRADA,
+                                       hacer_sitio, prioridad_alerta)
+
+def alerta(quirofano_id, variables):
+    return {"id": quirofano_id, "hora": "00:00:00", "variables": variables, "prioridad": prioridad_alerta(variables)}
+
+class PruebaDespachador(unittest.TestCase):
+    def setUp(self):
+        # Los reintentos y descartes se registran como avisos: no ensuciar la salida de las pruebas
+        logging.disable(logging.CRITICAL)
+        self.despachador = None
+
+    def tearDown(self):
+        if self.despachador is not None:
+            self.despachador.detener()
+        logging.disable(logging.NOTSET)
+
+    def iniciar(self, sumidero, renotificar=None):
+        self.despachador = DespachadorNotificaciones([sumidero], renotificar)
+        self.despachador.iniciar()
+        return self.despachador
+
+    def esperar(self, condicion, espera=5.0):
+        limite = time.monotonic() + espera
+        while not condicion():
+            self.assertLess(time.monotonic(), limite, "el despachador no terminó a tiempo")
+            time.sleep(0.01)
+
+    def test_alertas_juntas_en_un_lote(self):
+        sumidero = SumideroLocal()
+        sumidero.espera_lote = 0.2
+        despachador = self.iniciar(sumidero)
+        for quirofano_id in range(1, 6):
+            despachador.publicar(quirofano_id, "temperatura")
+
+        self.esperar(lambda: despachador.enviadas["local"] == 5)
+        self.assertEqual(len(sumidero.lotes), 1)
+        self.assertEqual([a["id"] for a in sumidero.lotes[0]], [1, 2, 3, 4, 5])
+
+    def test_reintento_con_espera_exponencial(self):
+        sumidero = SumideroLocal(fallos=2)
+        sumidero.espera_lote = 0.0
+        sumidero.espera_reintento = 0.1
+        despachador = self.iniciar(sumidero)
+        inicio = time.monotonic()
+        despachador.publicar(1, "presión")
+
+        self.esperar(lambda: despachador.enviadas["local"] == 1)
+        # Dos esperas, 0,1 s y 0,2 s, con hasta un 20 % menos por la aleatoriedad
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.8 * (0.1 + 0.2))
+        self.assertEqual(despachador.fallidas["local"], 0)
+        self.assertEqual(len(sumidero.lotes), 1)
+
+    def test_fallo_tras_agotar_los_reintentos(self):
+        sumidero = SumideroLocal(fallos=10)
+        sumidero.espera_lote = 0.0
+        sumidero.espera_reintento = 0.01
+        sumidero.reintentos = 2
+        despachador = self.iniciar(sumidero)
+        despachador.publicar(1, "presión")
+
+        self.esperar(lambda: despachador.fallidas["local"] == 1)
+        self.assertEqual(despachador.enviadas["local"], 0)
+        # Un intento y dos reintentos
+        self.assertEqual(sumidero.fallos, 7)
+
+    def test_tiempo_limite_por_intento(self):
+        sumidero = SumideroLocal(retardo=5.0)
+        sumidero.espera_lote = 0.0
+        sumidero.tiempo_limite = 0.05
+        sumidero.reintentos = 1
+        sumidero.espera_reintento = 0.01
+        despachador = self.iniciar(sumidero)
+        inicio = time.monotonic()
+        despachador.publicar(1, "presión")
+
+        # Cada intento se corta a los 0,05 s en lugar de esperar al sumidero bloqueado
+        self.esperar(lambda: despachador.fallidas["local"] == 1)
+        self.assertLess(time.monotonic() - inicio, 1.0)
+        self.assertEqual(len(sumidero.lotes), 0)
+
+    def test_alarma_solo_se_notifica_al_cambiar(self):
+        sumidero = SumideroLocal()
+        sumidero.espera_lote = 0.0
+        despachador = self.iniciar(sumidero)
+
+        notificadas = [despachador.actualizar_alarma(1, "temperatura"),
+                       despachador.actualizar_alarma(1, "temperatura"),
+                       despachador.actualizar_alarma(1, "temperatura, presión"),
+                       despachador.actualizar_alarma(1, "temperatura, presión"),
+                       despachador.actualizar_alarma(1, None),
+                       despachador.actualizar_alarma(1, "temperatura, presión"),
+                       despachador.actualizar_alarma(2, "humedad")]
+        self.assertEqual(notificadas, [True, False, True, False, False, True, True])
+
+        self.esperar(lambda: despachador.enviadas["local"] == 4)
+        enviadas = [(a["id"], a["variables"]) for lote in sumidero.lotes for a in lote]
+        self.assertEqual(enviadas, [(1, "temperatura"), (1, "temperatura, presión"),
+                                    (1, "temperatura, presión"), (2, "humedad")])
+
+    def test_renotificar_alarma_activa(self):
+        sumidero = SumideroLocal()
+        despachador = self.iniciar(sumidero, renotificar=0.1)
+        self.assertTrue(despachador.actualizar_alarma(1, "presión"))
+        self.assertFalse(despachador.actualizar_alarma(1, "presión"))
+        time.sleep(0.15)
+        self.assertTrue(despachador.actualizar_alarma(1, "presión"))
+
+class PruebaPrioridad(unittest.TestCase):
+    def test_hacer_sitio_descarta_la_menos_prioritaria_y_mas_antigua(self):
+        alertas = deque([alerta(1, "humedad"), alerta(2, "presión"), alerta(3, "humedad")])
+        self.assertTrue(hacer_sitio(alertas, alerta(4, "temperatura")))
+        self.assertEqual([a["id"] for a in alertas], [2, 3])
+
+    def test_hacer_sitio_rechaza_la_nueva_si_no_es_mas_prioritaria(self):
+        alertas = deque([alerta(1, "temperatura"), alerta(2, "presión")])
+        self.assertFalse(hacer_sitio(alertas, alerta(3, "temperatura")))
+        self.assertFalse(hacer_sitio(alertas, alerta(4, "humedad")))
+        self.assertEqual([a["id"] for a in alertas], [1, 2])
+
+    def test_descarte_en_la_cola_del_sumidero(self):
+        cola = ColaAlertas(2)
+        self.assertTrue(cola.poner(alerta(1, "humedad")))
+        self.assertTrue(cola.poner(alerta(2, "temperatura")))
+        self.assertTrue(cola.poner(alerta(3, "presión")))
+        self.assertFalse(cola.poner(alerta(4, "humedad")))
+        self.assertEqual([a["id"] for a in cola.alertas], [2, 3])
+        self.assertEqual(cola.descartadas, 2)
+
+    def test_descarte_a_la_entrada(self):
+        # Sin ejecutar el bucle la entrada no se drena y se llena
+        despachador = DespachadorNotificaciones([SumideroLocal()])
+        despachador.bucle = asyncio.new_event_loop()
+        try:
+            for i in range(CAPACIDAD_ENTRADA):
+                despachador.publicar(i, "humedad")
+            despachador.publicar(CAPACIDAD_ENTRADA, "presión")
+            despachador.publicar(CAPACIDAD_ENTRADA + 1, "humedad")
+        finally:
+            despachador.bucle.close()
+
+        self.assertEqual(len(despachador.entrada), CAPACIDAD_ENTRADA)
+        self.assertEqual(despachador.descartadas_entrada, 2)
+        # Se descartó la alerta de humedad más antigua y no entró la última
+        ids = [a["id"] for a in despachador.entrada]
+        self.assertEqual(ids[0], 1)
+        self.assertEqual(ids[-1], CAPACIDAD_ENTRADA)
+        self.assertEqual(despachador.estadisticas()["local"]["descartadas"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Pruebas de recuperación del checkpoint y del WAL ante escrituras interrumpidas.
+#
+# Uso:
+#   python -m pytest tests
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# Permitir importar los módulos desde la raíz del repositorio
+DIRECTORIO_TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_TESTS))
+
+from control_quirofanos import SensorSimulado, MAX_HISTORIAL, MAX_ALERTAS, INTERVALO_BASE
+from persistencia_quirofanos import (PersistenciaQuirofanos, codificar_registro, CABECERA, CABECERA_QUIROFANO,
+                                     TAMAÑO_RANURA_ALERTAS, LECTURA, WAL_LECTURA)
+
+class RelojPrueba:
+    # Avanza INTERVALO_BASE en cada lectura para que el historial no se diezme
+    def __init__(self, inicio):
+        self.ahora = inicio
+
+    def __call__(self):
+        self.ahora += INTERVALO_BASE
+        return self.ahora
+
+def historial(sensor):
+    return {"en_uso": sensor.en_uso, "timestamps": list(sensor.timestamps),
+            "temperatura": list(sensor.historial_temperatura)}
+
+def cargado(estado):
+    return {"en_uso": estado["en_uso"], "timestamps": estado["timestamps"], "temperatura": estado["temperatura"]}
+
+class PruebaPersistencia(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp(prefix="prueba_persistencia_")
+        self.sensores = [SensorSimulado(1), SensorSimulado(2)]
+        reloj = RelojPrueba(max(sensor.timestamps[-1] for sensor in self.sensores))
+        for sensor in self.sensores:
+            sensor.reloj = reloj
+
+        # Una sesión completa: checkpoint inicial, lecturas y checkpoint final al cerrar
+        persistencia = self.nueva_persistencia()
+        for sensor in self.sensores:
+            persistencia.registrar_sensor(sensor)
+        persistencia.iniciar()
+        self.esperar_archivo(persistencia.ruta_wal)
+        self.inicial = [historial(sensor) for sensor in self.sensores]
+
+        self.sensores[0].cambiar_estado(True)
+        for _ in range(5):
+            for sensor in self.sensores:
+                sensor.actualizar_datos.emit(sensor.generar_lectura())
+        persistencia.cerrar()
+        self.final = [historial(sensor) for sensor in self.sensores]
+        self.persistencia = persistencia
+
+    def tearDown(self):
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def nueva_persistencia(self):
+        return PersistenciaQuirofanos(self.directorio, MAX_HISTORIAL, MAX_ALERTAS, INTERVALO_BASE)
+
+    def esperar_archivo(self, ruta, espera=5.0):
+        # El WAL se abre cuando el hilo de escritura ha terminado el checkpoint inicial
+        limite = time.monotonic() + espera
+        while not os.path.exists(ruta):
+            self.assertLess(time.monotonic(), limite, "no se escribió el checkpoint inicial")
+            time.sleep(0.01)
+
+    def escribir_wal(self, contenido):
+        with open(self.persistencia.ruta_wal, "wb") as f:
+            f.write(contenido)
+
+    def lecturas_nuevas(self, sensor, n):
+        # Registros de WAL con lecturas posteriores al checkpoint, como si el proceso hubiera caído
+        ultimo = sensor.timestamps[-1]
+        return [codificar_registro(WAL_LECTURA, LECTURA.pack(sensor.quirofano_id, ultimo + (i + 1) * INTERVALO_BASE,
+                                                            20.0 + i, 50.0, 10.0))
+                for i in range(n)]
+
+    def test_reinicio_limpio(self):
+        self.assertEqual(os.path.getsize(self.persistencia.ruta_wal), 0)
+        estados, _ = self.nueva_persistencia().cargar()
+        for sensor, esperado in zip(self.sensores, self.final):
+            self.assertEqual(cargado(estados[sensor.quirofano_id]), esperado)
+
+    def test_ranura_corrupta_usa_la_anterior(self):
+        # Corromper la ranura más reciente del quirófano 1 simula un checkpoint interrumpido
+        persistencia = self.persistencia
+        base = CABECERA.size + 2 * TAMAÑO_RANURA_ALERTAS
+        with open(persistencia.ruta_checkpoint, "r+b") as f:
+            datos = f.read()
+            ranuras = [base + ranura * persistencia.tamaño_ranura for ranura in range(2)]
+            reciente = max(ranuras, key=lambda desplazamiento: CABECERA_QUIROFANO.unpack_from(datos, desplazamiento)[2])
+            f.seek(reciente + CABECERA_QUIROFANO.size + 8)
+            f.write(bytes([datos[reciente + CABECERA_QUIROFANO.size + 8] ^ 0xFF]))
+
+        estados, _ = self.nueva_persistencia().cargar()
+        self.assertEqual(cargado(estados[1]), self.inicial[0])
+        self.assertEqual(cargado(estados[2]), self.final[1])
+
+    def test_wal_truncado(self):
+        sensor = self.sensores[0]
+        repetida = codificar_registro(WAL_LECTURA, LECTURA.pack(1, sensor.timestamps[-1], 99.0, 99.0, 99.0))
+        registros = self.lecturas_nuevas(sensor, 3)
+        self.escribir_wal(repetida + b"".join(registros)[:-5])
+
+        estados, _ = self.nueva_persistencia().cargar()
+        timestamps = estados[1]["timestamps"]
+        # La lectura ya incluida en el checkpoint se ignora y la última, incompleta, se descarta
+        self.assertEqual(timestamps[:-2], self.final[0]["timestamps"])
+        self.assertEqual(timestamps[-2:], [sensor.timestamps[-1] + INTERVALO_BASE, sensor.timestamps[-1] + 2 * INTERVALO_BASE])
+        self.assertEqual(estados[1]["temperatura"][-2:], [20.0, 21.0])
+
+    def test_wal_corrupto(self):
+        sensor = self.sensores[0]
+        registros = self.lecturas_nuevas(sensor, 3)
+        corrupto = bytearray(registros[1])
+        corrupto[-1] ^= 0xFF
+        self.escribir_wal(registros[0] + bytes(corrupto) + registros[2])
+
+        # Se aplica hasta el primer registro con CRC incorrecto
+        estados, _ = self.nueva_persistencia().cargar()
+        self.assertEqual(estados[1]["timestamps"][-1], sensor.timestamps[-1] + INTERVALO_BASE)
+        self.assertEqual(estados[1]["timestamps"][:-1], self.final[0]["timestamps"])
+        self.assertEqual(cargado(estados[2]), self.final[1])
+
+if __name__ == '__main__':
+    unittest.main()
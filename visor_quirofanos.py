@@ -0,0 +1,197 @@
+# Visor ligero: muestra la misma interfaz que control_quirofanos.py pero recibe los datos
+# de un servidor_quirofanos.py en lugar de simular sus propios sensores.
+#
+# Uso:
+#   python visor_quirofanos.py                        # todos los quirófanos, socket local
+#   python visor_quirofanos.py --quirofanos 1,2,3     # solo algunos quirófanos
+#   python visor_quirofanos.py --puerto 5800          # conectar por TCP loopback
+import sys
+import argparse
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtNetwork import QLocalSocket, QTcpSocket
+
+from control_quirofanos import (VentanaPrincipal, NUM_QUIROFANOS, MAX_HISTORIAL, fecha_grafica,
+                                sustituir_ultima_muestra)
+from servidor_quirofanos import NOMBRE_SOCKET, LectorMensajes, codificar_mensaje
+
+# Espera antes de reintentar la conexión con el servidor
+INTERVALO_RECONEXION_MS = 2000
+
+# Sensor que replica el estado de un quirófano del servidor con la interfaz de SensorSimulado
+class SensorRemoto(QObject):
+    actualizar_datos = pyqtSignal(dict)
+    estado_cambiado = pyqtSignal(bool)
+
+    def __init__(self, quirofano_id, cliente):
+        super().__init__(cliente)
+        self.quirofano_id = quirofano_id
+        self.cliente = cliente
+        self.en_uso = False
+
+        # Historiales recibidos del servidor
+        self.historial_temperatura = []
+        self.historial_humedad = []
+        self.historial_presion = []
+        self.timestamps = []
+        self.historial_fechas = []
+
+    def cargar(self, estado):
+        # Reemplazar los historiales con el snapshot del servidor
+        self.timestamps = estado["timestamps"]
+        self.historial_temperatura = estado["temperatura"]
+        self.historial_humedad = estado["humedad"]
+        self.historial_presion = estado["presion"]
+        self.historial_fechas = [fecha_grafica(ts) for ts in self.timestamps]
+        self.aplicar_estado(estado["en_uso"])
+        if self.timestamps:
+            self.emitir()
+
+    def copiar_historial(self):
+        # Mismo formato que SensorSimulado; aquí los historiales solo cambian en el hilo de la interfaz
+        return {
+            'timestamps': list(self.timestamps),
+            'fechas': list(self.historial_fechas),
+            'temperatura': list(self.historial_temperatura),
+            'humedad': list(self.historial_humedad),
+            'presion': list(self.historial_presion)
+        }
+
+    def agregar_lectura(self, lectura):
+        # Diezmar igual que el sensor del servidor para conservar la misma ventana de tiempo
+        fecha = fecha_grafica(lectura["timestamp"])
+        if sustituir_ultima_muestra(self.timestamps):
+            self.historial_temperatura[-1] = lectura["temperatura"]
+            self.historial_humedad[-1] = lectura["humedad"]
+            self.historial_presion[-1] = lectura["presion"]
+            self.timestamps[-1] = lectura["timestamp"]
+            self.historial_fechas[-1] = fecha
+        else:
+            self.historial_temperatura.append(lectura["temperatura"])
+            self.historial_humedad.append(lectura["humedad"])
+            self.historial_presion.append(lectura["presion"])
+            self.timestamps.append(lectura["timestamp"])
+            self.historial_fechas.append(fecha)
+
+        # Mantener solo los últimos registros
+        if len(self.historial_temperatura) > MAX_HISTORIAL:
+            self.historial_temperatura.pop(0)
+            self.historial_humedad.pop(0)
+            self.historial_presion.pop(0)
+            self.timestamps.pop(0)
+            self.historial_fechas.pop(0)
+
+        self.en_uso = lectura["en_uso"]
+        self.emitir()
+
+    def emitir(self):
+        self.actualizar_datos.emit({
+            'temperatura': self.historial_temperatura[-1],
+            'humedad': self.historial_humedad[-1],
+            'presion': self.historial_presion[-1],
+            'timestamp': self.timestamps[-1],
+            'en_uso': self.en_uso
+        })
+
+    def aplicar_estado(self, en_uso):
+        self.en_uso = en_uso
+        self.estado_cambiado.emit(en_uso)
+
+    def cambiar_estado(self, en_uso):
+        # El servidor confirma el cambio a todos los visores con un mensaje "estado"
+        self.en_uso = en_uso
+        self.cliente.enviar({"tipo": "cambiar_estado", "id": self.quirofano_id, "en_uso": en_uso})
+
+# Conexión con el servidor de adquisición
+class ClienteQuirofanos(QObject):
+    alertas_recibidas = pyqtSignal(list)
+
+    def __init__(self, quirofanos, nombre=NOMBRE_SOCKET, puerto=None, parent=None):
+        super().__init__(parent)
+        self.nombre = nombre
+        self.puerto = puerto
+        self.conectado = False
+        self.lector = LectorMensajes()
+
+        # Un sensor remoto por cada quirófano que muestra este visor
+        self.sensores = {quirofano_id: SensorRemoto(quirofano_id, self) for quirofano_id in quirofanos}
+
+        self.socket = QLocalSocket(self) if puerto is None else QTcpSocket(self)
+        self.socket.connected.connect(self.al_conectar)
+        self.socket.disconnected.connect(self.al_desconectar)
+        self.socket.errorOccurred.connect(self.al_desconectar)
+        self.socket.readyRead.connect(self.leer)
+
+        # Reintentar la conexión mientras el servidor no esté disponible
+        self.timer_reconexion = QTimer(self)
+        self.timer_reconexion.setSingleShot(True)
+        self.timer_reconexion.setInterval(INTERVALO_RECONEXION_MS)
+        self.timer_reconexion.timeout.connect(self.conectar)
+
+    def conectar(self):
+        self.lector = LectorMensajes()
+        if self.puerto is None:
+            self.socket.connectToServer(self.nombre)
+        else:
+            self.socket.connectToHost("127.0.0.1", self.puerto)
+
+    def al_conectar(self):
+        self.conectado = True
+        self.enviar({"tipo": "suscribir", "quirofanos": sorted(self.sensores)})
+
+    def al_desconectar(self, *_):
+        self.conectado = False
+        self.socket.abort()
+        if not self.timer_reconexion.isActive():
+            self.timer_reconexion.start()
+
+    def enviar(self, mensaje):
+        if self.conectado:
+            self.socket.write(codificar_mensaje(mensaje))
+
+    def leer(self):
+        for mensaje in self.lector.leer(bytes(self.socket.readAll())):
+            tipo = mensaje.get("tipo")
+            if tipo == "lectura":
+                sensor = self.sensores.get(mensaje["id"])
+                if sensor is not None:
+                    sensor.agregar_lectura(mensaje)
+            elif tipo == "estado":
+                sensor = self.sensores.get(mensaje["id"])
+                if sensor is not None:
+                    sensor.aplicar_estado(mensaje["en_uso"])
+            elif tipo == "snapshot":
+                for estado in mensaje["quirofanos"]:
+                    sensor = self.sensores.get(estado["id"])
+                    if sensor is not None:
+                        sensor.cargar(estado)
+                self.alertas_recibidas.emit(mensaje["alertas"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Visor de quirófanos conectado a un servidor")
+    parser.add_argument("--quirofanos", default=",".join(str(i + 1) for i in range(NUM_QUIROFANOS)),
+                        help="quirófanos a mostrar, separados por comas")
+    parser.add_argument("--socket", default=NOMBRE_SOCKET, help="nombre del socket local")
+    parser.add_argument("--puerto", type=int, help="conectar por TCP a 127.0.0.1 en lugar del socket local")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    quirofanos = [int(q) for q in args.quirofanos.split(",") if q]
+    cliente = ClienteQuirofanos(quirofanos, args.socket, args.puerto)
+    ventana = VentanaPrincipal(sensores=list(cliente.sensores.values()))
+    ventana.setWindowTitle(f"{ventana.windowTitle()} - Visor")
+
+    def reproducir_alertas(alertas):
+        # El snapshot trae las alertas recientes del servidor, de la más antigua a la más nueva
+        ventana.pestaña_general.limpiar_alertas()
+        for alerta in alertas:
+            ventana.mostrar_alerta(alerta["id"], alerta["variables"], alerta["hora"])
+
+    cliente.alertas_recibidas.connect(reproducir_alertas)
+    cliente.conectar()
+    ventana.show()
+    return app.exec_()
+
+if __name__ == '__main__':
+    sys.exit(main())